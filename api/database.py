@@ -3,7 +3,10 @@ Database configuration for FastAPI application
 """
 
 import os
+from typing import Union
 from sqlalchemy import create_engine, text
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -14,8 +17,27 @@ load_dotenv()
 # Database configuration
 DATABASE_URL = f"postgresql://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'medical_warehouse')}"
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Connection budget: every uvicorn worker process has its own pool, so the API as a whole may open
+# up to API_WORKERS x (pool_size + max_overflow) connections. DB_CONNECTION_BUDGET caps that total
+# (default 60, leaving room for the pipeline and dbt under Postgres' default max_connections=100)
+# and is split evenly across workers; DB_POOL_SIZE / DB_MAX_OVERFLOW override the per-worker split.
+API_WORKERS = int(os.getenv('API_WORKERS', os.cpu_count() or 1))
+DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', '60'))
+WORKER_CONNECTIONS = max(DB_CONNECTION_BUDGET // API_WORKERS, 2)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', WORKER_CONNECTIONS // 2))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', WORKER_CONNECTIONS - WORKER_CONNECTIONS // 2))
+
+# Create SQLAlchemy engine with an explicitly sized connection pool
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '5')),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    echo_pool="debug" if os.getenv('DB_ECHO_POOL', '').lower() in ('1', 'true', 'yes') else False
+)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -32,19 +54,20 @@ def get_db():
     finally:
         db.close()
 
-def execute_query(query: str, params: dict = None):
-    """Execute a raw SQL query and return results"""
+def fetch_mappings(query: Union[str, TextClause], params: dict = None, connection=None):
+    """Execute a raw SQL query and return its rows as name-addressable mappings
+
+    ``query`` may be a prebuilt ``text()`` clause so it is only parsed once.
+    Pass an open ``connection`` to run several queries on the same pooled
+    connection; otherwise one is checked out for this query only.
+    """
+    statement = text(query) if isinstance(query, str) else query
+
+    if connection is not None:
+        return connection.execute(statement, params or {}).mappings().all()
+
     with engine.connect() as connection:
-        result = connection.execute(text(query), params or {})
-        return result.fetchall()
-
-def execute_query_to_dataframe(query: str, params: dict = None):
-    """Execute a query and return results as a list of dictionaries"""
-    results = execute_query(query, params)
-    if results:
-        columns = results[0]._fields
-        return [dict(row._mapping) for row in results]
-    return []
+        return connection.execute(statement, params or {}).mappings().all()
 
 # Test database connection
 def test_connection():
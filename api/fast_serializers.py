@@ -0,0 +1,46 @@
+"""
+Direct row-to-JSON serializers for endpoints that echo warehouse rows unchanged
+
+The response schemas still document these payloads in OpenAPI; at runtime the
+rows are trusted (types are enforced by the dbt marts) and go straight to orjson.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+import orjson
+
+from responses import orjson_default
+from schemas import MessageResult, ProductMention
+
+MESSAGE_FIELDS = tuple(MessageResult.model_fields)
+PRODUCT_FIELDS = tuple(ProductMention.model_fields)
+
+def _project(rows: Sequence[Any], fields: Sequence[str]) -> list:
+    """Keep only the contract fields of each row; a missing column raises KeyError"""
+    return [{field: row[field] for field in fields} for row in rows]
+
+def _envelope(**payload) -> bytes:
+    """Wrap a payload in the BaseResponse fields and dump it"""
+    return orjson.dumps(
+        {"success": True, "message": None, "timestamp": datetime.now(), **payload},
+        default=orjson_default
+    )
+
+def dump_messages_json(rows: Sequence[Any], total_found: Optional[int], query_params: Dict[str, Any],
+                       next_cursor: Optional[str] = None) -> bytes:
+    """Serialize message search rows as a MessageSearchResponse body"""
+    return _envelope(
+        messages=_project(rows, MESSAGE_FIELDS),
+        total_found=total_found,
+        query_params=query_params,
+        next_cursor=next_cursor
+    )
+
+def dump_top_products_json(rows: Sequence[Any], total_analyzed: int, query_params: Dict[str, Any]) -> bytes:
+    """Serialize top term rows as a TopProductsResponse body"""
+    return _envelope(
+        data=_project(rows, PRODUCT_FIELDS),
+        total_analyzed=total_analyzed,
+        query_params=query_params
+    )
@@ -3,31 +3,72 @@ FastAPI application for Ethiopian Medical Business Data Analytics
 """
 
 from fastapi import FastAPI, HTTPException, Query, Path
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
 from typing import List, Optional, Dict, Any
+from sqlalchemy import text
+import structlog
+import asyncio
+import base64
+import itertools
+import json
 import logging
+import os
+import queue
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
-from database import execute_query_to_dataframe, test_connection
+from database import API_WORKERS, fetch_mappings, test_connection
+from middleware import ETagMiddleware
+from fast_serializers import dump_messages_json, dump_top_products_json
+from responses import JSON_MEDIA_TYPE, JSONBytesCoder, json_response
 from schemas import (
     TopProductsResponse, ProductMention,
     ChannelActivityResponse, ChannelStats, DailyActivity,
-    MessageSearchResponse, MessageResult,
+    MessageSearchResponse,
     VisualContentResponse, ChannelVisualStats, VisualContentSummary,
-    ErrorResponse
+    ErrorResponse, list_adapter
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: handlers only enqueue records, a background listener renders them as JSON lines
+log_queue = queue.Queue(-1)
+json_log_handler = logging.StreamHandler(sys.stderr)
+json_log_handler.setFormatter(structlog.stdlib.ProcessorFormatter(
+    foreign_pre_chain=[
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.add_logger_name,
+        structlog.processors.TimeStamper(fmt="iso")
+    ],
+    processors=[
+        structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+        structlog.processors.JSONRenderer()
+    ]
+))
+log_listener = QueueListener(log_queue, json_log_handler)
+log_listener.start()
+queue_log_handler = QueueHandler(log_queue)
+queue_log_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[queue_log_handler])
 logger = logging.getLogger(__name__)
 
+# Search queries matching this are looked up via full-text search
+WORD_QUERY_PATTERN = re.compile(r"\w+")
+
 # Create FastAPI app
 app = FastAPI(
     title="Ethiopian Medical Business Analytics API",
     description="REST API for analyzing Ethiopian medical business data from Telegram channels",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -39,12 +80,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Add ETag / 304 support for analytics endpoints
+app.add_middleware(ETagMiddleware)
+
+@app.on_event("startup")
+async def init_cache():
+    """Initialize the response cache (Redis when REDIS_URL is set, in-memory otherwise)"""
+    redis_url = os.getenv('REDIS_URL')
+    if redis_url:
+        from redis import asyncio as aioredis
+        from fastapi_cache.backends.redis import RedisBackend
+        
+        backend = RedisBackend(aioredis.from_url(redis_url))
+    else:
+        backend = InMemoryBackend()
+    
+    # Bodies are cached as serialized bytes and replayed without re-encoding
+    FastAPICache.init(backend, prefix="med-api", coder=JSONBytesCoder)
+    logger.info(f"Response cache initialized with {type(backend).__name__}")
+
+# Last known database status, refreshed in the background so probes never wait on the DB
+HEALTH_TTL = 5
+_health_cache = {"status": False, "ts": 0.0}
+
+async def refresh_health_status() -> bool:
+    """Probe the database and record the result"""
+    status = await run_in_threadpool(test_connection)
+    _health_cache.update(status=status, ts=time.monotonic())
+    return status
+
+async def periodic_health_refresh():
+    """Keep the cached database status fresh"""
+    while True:
+        try:
+            await refresh_health_status()
+        except Exception as e:
+            logger.error(f"Background health refresh failed: {e}")
+        await asyncio.sleep(HEALTH_TTL)
+
+@app.on_event("startup")
+async def start_health_refresh():
+    """Start the background database probe"""
+    app.state.health_task = asyncio.create_task(periodic_health_refresh())
+
+@app.on_event("shutdown")
+async def stop_health_refresh():
+    """Stop the background database probe"""
+    app.state.health_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_log_listener():
+    """Flush queued log records and stop the listener thread"""
+    log_listener.stop()
+
 # Health check endpoint
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Check if the API and database are working"""
     try:
-        db_status = test_connection()
+        if time.monotonic() - _health_cache["ts"] < HEALTH_TTL:
+            db_status = _health_cache["status"]
+        else:
+            db_status = await refresh_health_status()
         return {
             "status": "healthy" if db_status else "unhealthy",
             "database": "connected" if db_status else "disconnected",
@@ -65,7 +162,72 @@ async def root():
     }
 
 # Endpoint 1: Top Products
-@app.get("/api/reports/top-products", response_model=TopProductsResponse, tags=["Reports"])
+# SQL query to find top mentioned terms (pre-aggregated per day in mart_top_terms_daily)
+TOP_PRODUCTS_TEMPLATE = """
+    WITH analyzed_messages AS (
+        SELECT message_id
+        FROM analytics.fct_messages
+        WHERE message_text IS NOT NULL 
+        AND length(message_text) > 0
+        {date_clause}
+    ),
+    term_stats AS (
+        SELECT 
+            term,
+            SUM(mention_count)::bigint as mention_count,
+            SUM(total_views)::bigint as total_views
+        FROM analytics.mart_top_terms_daily
+        WHERE true
+        {date_clause}
+        GROUP BY term
+        HAVING SUM(mention_count) >= :min_mentions
+    ),
+    top_terms AS (
+        SELECT 
+            term,
+            mention_count,
+            total_views,
+            ROUND(total_views::numeric / mention_count, 2) as avg_views,
+            -- Channels are only resolved for the terms that made the cut
+            (
+                SELECT array_agg(channel)
+                FROM (
+                    SELECT DISTINCT channel
+                    FROM analytics.mart_top_terms_daily daily, unnest(daily.channels) channel
+                    WHERE daily.term = term_stats.term
+                    {date_clause}
+                ) term_channels
+            ) as channels
+        FROM term_stats
+        ORDER BY mention_count DESC, total_views DESC
+        LIMIT :limit
+    )
+    -- Total analyzed count rides along on every row (one row with NULL term if nothing matched)
+    SELECT 
+        totals.total_messages,
+        top_terms.*
+    FROM (SELECT COUNT(*) as total_messages FROM analyzed_messages) totals
+    LEFT JOIN top_terms ON true
+    ORDER BY top_terms.mention_count DESC, top_terms.total_views DESC
+"""
+
+def _date_clause(has_date_from: bool, has_date_to: bool) -> str:
+    """Build the optional date filter appended to each top products subquery"""
+    conditions = []
+    if has_date_from:
+        conditions.append("message_date >= :date_from")
+    if has_date_to:
+        conditions.append("message_date <= :date_to")
+    return "AND " + " AND ".join(conditions) if conditions else ""
+
+# One prebuilt statement per combination of date filters, keyed by (date_from given, date_to given)
+TOP_PRODUCTS_SQL = {
+    (has_from, has_to): text(TOP_PRODUCTS_TEMPLATE.format(date_clause=_date_clause(has_from, has_to)))
+    for has_from, has_to in itertools.product((False, True), repeat=2)
+}
+
+@app.get("/api/reports/top-products", responses={200: {"model": TopProductsResponse}}, tags=["Reports"])
+@cache(expire=300)
 async def get_top_products(
     limit: int = Query(default=10, ge=1, le=100, description="Maximum number of results to return"),
     min_mentions: int = Query(default=1, ge=1, description="Minimum number of mentions required"),
@@ -79,113 +241,33 @@ async def get_top_products(
     drugs, and health-related terms mentioned in Telegram channels.
     """
     try:
-        # Build WHERE clause for date filtering
-        date_conditions = []
         params = {"min_mentions": min_mentions, "limit": limit}
         
         if date_from:
-            date_conditions.append("fm.message_date >= %(date_from)s")
             params["date_from"] = date_from
         
         if date_to:
-            date_conditions.append("fm.message_date <= %(date_to)s")
             params["date_to"] = date_to
         
-        date_clause = "AND " + " AND ".join(date_conditions) if date_conditions else ""
-        
-        # SQL query to find top mentioned terms
-        query = f"""
-        WITH message_terms AS (
-            SELECT 
-                fm.message_id,
-                fm.channel_name,
-                fm.message_date,
-                fm.view_count,
-                fm.message_text,
-                -- Extract potential medical/product terms (simplified approach)
-                regexp_split_to_table(lower(fm.message_text), '[\s.,;:!?()]+') as term
-            FROM analytics.fct_messages fm
-            WHERE fm.message_text IS NOT NULL 
-            AND length(fm.message_text) > 0
-            {date_clause}
-        ),
-        filtered_terms AS (
-            SELECT 
-                term,
-                message_id,
-                channel_name,
-                view_count,
-                -- Filter for likely medical/product terms
-                CASE 
-                    WHEN term ~ any(ARRAY['^(amoxicillin|paracetamol|ibuprofen|aspirin|penicillin|vitamin|calcium|iron|zinc|medicine|drug|tablet|capsule|syrup|cream|ointment|injection|vaccine|antibiotic|pain|fever|cold|cough|headache|blood|pressure|diabetes|sugar|insulin|pills|medication|pharmacy|hospital|doctor|nurse|treatment|cure|heal|health|medical|clinical|prescription|dose|mg|ml|gram|box|bottle|pack|strip)$')
-                    THEN 1
-                    WHEN length(term) >= 3 AND term ~ any(ARRAY['[a-z]+[0-9]+', '[0-9]+[a-z]+'])  -- Alphanumeric terms
-                    THEN 1
-                    WHEN length(term) >= 4 AND term ~ any(ARRAY['^(anti|bio|medi|pharma|thera|surg|dent|opti|cardio|neuro|gastro|derma|pedi|ortho)$'])
-                    THEN 1
-                    ELSE 0
-                END as is_medical_term
-            FROM message_terms
-            WHERE length(term) >= 3
-            AND term NOT IN (SELECT unnest(ARRAY['the', 'and', 'for', 'are', 'with', 'you', 'that', 'this', 'from', 'they', 'have', 'been', 'has', 'had', 'what', 'will', 'your', 'can', 'said', 'each', 'which', 'their', 'time', 'will', 'about', 'if', 'up', 'out', 'many', 'then', 'them', 'these', 'so', 'some', 'her', 'would', 'make', 'like', 'into', 'him', 'two', 'more', 'very', 'after', 'back', 'call', 'through', 'just', 'also', 'even', 'most', 'such', 'too', 'much', 'well', 'were', 'me', 'first', 'may', 'when', 'where', 'how', 'old', 'did', 'come', 'his', 'there', 'www', 'com', 'http', 'https', 'tme', 'telegram']))
-        ),
-        term_stats AS (
-            SELECT 
-                term,
-                COUNT(*) as mention_count,
-                SUM(view_count) as total_views,
-                AVG(view_count) as avg_views,
-                array_agg(DISTINCT channel_name) as channels
-            FROM filtered_terms
-            WHERE is_medical_term = 1
-            GROUP BY term
-            HAVING COUNT(*) >= %(min_mentions)s
-        )
-        SELECT 
-            term,
-            mention_count,
-            total_views,
-            avg_views,
-            channels
-        FROM term_stats
-        ORDER BY mention_count DESC, total_views DESC
-        LIMIT %(limit)s
-        """
-        
-        results = execute_query_to_dataframe(query, params)
-        
-        # Convert to response format
-        products = []
-        for result in results:
-            products.append(ProductMention(
-                term=result['term'],
-                mention_count=result['mention_count'],
-                total_views=result['total_views'],
-                avg_views=round(result['avg_views'], 2),
-                channels=result['channels']
-            ))
+        stmt = TOP_PRODUCTS_SQL[(bool(date_from), bool(date_to))]
         
-        # Get total analyzed count
-        total_query = f"""
-        SELECT COUNT(*) as total_messages
-        FROM analytics.fct_messages fm
-        WHERE fm.message_text IS NOT NULL 
-        AND length(fm.message_text) > 0
-        {date_clause}
-        """
-        
-        total_result = execute_query_to_dataframe(total_query, params)
-        total_analyzed = total_result[0]['total_messages'] if total_result else 0
-        
-        return TopProductsResponse(
-            data=products,
-            total_analyzed=total_analyzed,
-            query_params={
-                "limit": limit,
-                "min_mentions": min_mentions,
-                "date_from": date_from,
-                "date_to": date_to
-            }
+        results = await run_in_threadpool(fetch_mappings, stmt, params)
+        
+        total_analyzed = results[0]['total_messages'] if results else 0
+        
+        # Rows already match ProductMention, so they are dumped without building models
+        return Response(
+            content=dump_top_products_json(
+                [result for result in results if result['term'] is not None],
+                total_analyzed=total_analyzed,
+                query_params={
+                    "limit": limit,
+                    "min_mentions": min_mentions,
+                    "date_from": date_from,
+                    "date_to": date_to
+                }
+            ),
+            media_type=JSON_MEDIA_TYPE
         )
         
     except Exception as e:
@@ -193,7 +275,57 @@ async def get_top_products(
         raise HTTPException(status_code=500, detail="Failed to retrieve top products data")
 
 # Endpoint 2: Channel Activity
-@app.get("/api/channels/{channel_name}/activity", response_model=ChannelActivityResponse, tags=["Channels"])
+CHANNEL_STATS_SQL = text("""
+    SELECT 
+        dc.channel_name,
+        dc.channel_type,
+        dc.total_posts,
+        dc.total_views,
+        dc.posts_with_images,
+        dc.first_post_date,
+        dc.last_post_date,
+        GREATEST(dc.last_post_date::date - dc.first_post_date::date, 1) as active_days
+    FROM analytics.dim_channels dc
+    WHERE dc.channel_name = :channel_name
+""")
+
+CHANNEL_DAILY_ACTIVITY_SQL = text("""
+    SELECT 
+        dd.full_date as date,
+        COUNT(*) as message_count,
+        SUM(fm.view_count) as total_views,
+        COUNT(CASE WHEN fm.has_image = true THEN 1 END) as messages_with_images
+    FROM analytics.fct_messages fm
+    JOIN analytics.dim_dates dd ON fm.date_key = dd.date_key
+    WHERE fm.channel_key = (SELECT channel_key FROM analytics.dim_channels WHERE channel_name = :channel_name)
+    AND dd.full_date >= CURRENT_DATE - make_interval(days => :days)
+    GROUP BY dd.full_date
+    ORDER BY dd.full_date DESC
+""")
+
+CHANNEL_TOP_TERMS_SQL = text("""
+    WITH term_stats AS (
+        SELECT 
+            mt.term,
+            COUNT(*) as mention_count,
+            SUM(mt.view_count) as total_views,
+            ROUND(AVG(mt.view_count), 2) as avg_views,
+            -- Every row belongs to the one requested channel
+            ARRAY[MIN(mt.channel_name)] as channels
+        FROM analytics.fct_message_terms mt
+        WHERE mt.channel_key = (SELECT channel_key FROM analytics.dim_channels WHERE channel_name = :channel_name)
+        AND mt.message_date >= CURRENT_DATE - make_interval(days => :days)
+        GROUP BY mt.term
+        HAVING COUNT(*) >= 2
+    )
+    SELECT term, mention_count, total_views, avg_views, channels
+    FROM term_stats
+    ORDER BY mention_count DESC, total_views DESC
+    LIMIT 10
+""")
+
+@app.get("/api/channels/{channel_name}/activity", responses={200: {"model": ChannelActivityResponse}}, tags=["Channels"])
+@cache(expire=300)
 async def get_channel_activity(
     channel_name: str = Path(..., description="Name of the channel to analyze"),
     days: int = Query(default=30, ge=1, le=365, description="Number of days of activity to analyze"),
@@ -211,121 +343,48 @@ async def get_channel_activity(
             "days": days
         }
         
-        # Get channel statistics
-        channel_query = """
-        SELECT 
-            dc.channel_name,
-            dc.channel_type,
-            dc.total_posts,
-            dc.avg_views,
-            dc.image_percentage,
-            dc.first_post_date,
-            dc.last_post_date,
-            ROUND(dc.total_posts::decimal / NULLIF(dc.total_posts, 0) / 
-                   GREATEST(EXTRACT(EPOCH FROM (dc.last_post_date - dc.first_post_date)) / 86400, 1), 2) as avg_daily_posts
-        FROM analytics.dim_channels dc
-        WHERE dc.channel_name = %(channel_name)s
-        """
-        
-        channel_results = execute_query_to_dataframe(channel_query, params)
+        # The three queries are independent, so they run concurrently on pooled connections off the event loop
+        queries = [
+            run_in_threadpool(fetch_mappings, CHANNEL_STATS_SQL, params),
+            run_in_threadpool(fetch_mappings, CHANNEL_DAILY_ACTIVITY_SQL, params)
+        ]
+        if include_top_terms:
+            queries.append(run_in_threadpool(fetch_mappings, CHANNEL_TOP_TERMS_SQL, params))
+        channel_results, activity_results, *terms_results = await asyncio.gather(*queries)
         
         if not channel_results:
             raise HTTPException(status_code=404, detail=f"Channel '{channel_name}' not found")
         
         channel_data = channel_results[0]
         
-        # Get daily activity
-        activity_query = """
-        SELECT 
-            dd.full_date as date,
-            COUNT(*) as message_count,
-            SUM(fm.view_count) as total_views,
-            ROUND(AVG(fm.view_count), 2) as avg_views,
-            COUNT(CASE WHEN fm.has_image = true THEN 1 END) as messages_with_images
-        FROM analytics.fct_messages fm
-        JOIN analytics.dim_dates dd ON fm.date_key = dd.date_key
-        WHERE fm.channel_key = (SELECT channel_key FROM analytics.dim_channels WHERE channel_name = %(channel_name)s)
-        AND dd.full_date >= CURRENT_DATE - INTERVAL '%(days)s days'
-        GROUP BY dd.full_date
-        ORDER BY dd.full_date DESC
-        """
-        
-        activity_results = execute_query_to_dataframe(activity_query, params)
-        
         daily_activity = []
         for result in activity_results:
-            daily_activity.append(DailyActivity(
+            daily_activity.append(DailyActivity.model_construct(
                 date=result['date'].strftime('%Y-%m-%d'),
                 message_count=result['message_count'],
-                total_views=result['total_views'],
-                avg_views=result['avg_views'],
+                total_views=int(result['total_views']),
                 messages_with_images=result['messages_with_images']
             ))
         
-        # Get top terms for this channel (if requested)
+        # Top terms for this channel (if requested)
         top_terms = []
         if include_top_terms:
-            terms_query = """
-            WITH channel_terms AS (
-                SELECT 
-                    regexp_split_to_table(lower(fm.message_text), '[\s.,;:!?()]+') as term,
-                    fm.view_count,
-                    fm.channel_name
-                FROM analytics.fct_messages fm
-                WHERE fm.channel_key = (SELECT channel_key FROM analytics.dim_channels WHERE channel_name = %(channel_name)s)
-                AND fm.message_text IS NOT NULL 
-                AND length(fm.message_text) > 0
-                AND fm.message_date >= CURRENT_DATE - INTERVAL '%(days)s days'
-            ),
-            filtered_terms AS (
-                SELECT term, view_count, channel_name
-                FROM channel_terms
-                WHERE length(term) >= 3
-                AND term NOT IN (SELECT unnest(ARRAY['the', 'and', 'for', 'are', 'with', 'you', 'that', 'this', 'from', 'they', 'have', 'been', 'has', 'had', 'what', 'will', 'your', 'can', 'said', 'each', 'which', 'their', 'time', 'will', 'about', 'if', 'up', 'out', 'many', 'then', 'them', 'these', 'so', 'some', 'her', 'would', 'make', 'like', 'into', 'him', 'two', 'more', 'very', 'after', 'back', 'call', 'through', 'just', 'also', 'even', 'most', 'such', 'too', 'much', 'well', 'were', 'me', 'first', 'may', 'when', 'where', 'how', 'old', 'did', 'come', 'his', 'there', 'www', 'com', 'http', 'https', 'tme', 'telegram']))
-            ),
-            term_stats AS (
-                SELECT 
-                    term,
-                    COUNT(*) as mention_count,
-                    SUM(view_count) as total_views,
-                    AVG(view_count) as avg_views,
-                    array_agg(DISTINCT channel_name) as channels
-                FROM filtered_terms
-                GROUP BY term
-                HAVING COUNT(*) >= 2
-            )
-            SELECT term, mention_count, total_views, avg_views, channels
-            FROM term_stats
-            ORDER BY mention_count DESC, total_views DESC
-            LIMIT 10
-            """
-            
-            terms_results = execute_query_to_dataframe(terms_query, params)
-            
-            for result in terms_results:
-                top_terms.append(ProductMention(
-                    term=result['term'],
-                    mention_count=result['mention_count'],
-                    total_views=result['total_views'],
-                    avg_views=round(result['avg_views'], 2),
-                    channels=result['channels']
-                ))
-        
-        return ChannelActivityResponse(
+            top_terms = list_adapter(ProductMention).validate_python(terms_results[0])
+        
+        return json_response(ChannelActivityResponse(
             channel_info=ChannelStats(
                 channel_name=channel_data['channel_name'],
                 channel_type=channel_data['channel_type'],
                 total_messages=channel_data['total_posts'],
-                avg_daily_posts=channel_data['avg_daily_posts'],
                 total_views=channel_data['total_views'] or 0,
-                avg_views_per_post=channel_data['avg_views'] or 0.0,
-                image_percentage=channel_data['image_percentage'] or 0.0,
+                messages_with_images=channel_data['posts_with_images'],
+                active_days=channel_data['active_days'],
                 first_post_date=str(channel_data['first_post_date']) if channel_data['first_post_date'] else None,
                 last_post_date=str(channel_data['last_post_date']) if channel_data['last_post_date'] else None
             ),
             daily_activity=daily_activity,
             top_terms=top_terms
-        )
+        ))
         
     except HTTPException:
         raise
@@ -334,122 +393,182 @@ async def get_channel_activity(
         raise HTTPException(status_code=500, detail="Failed to retrieve channel activity data")
 
 # Endpoint 3: Message Search
-@app.get("/api/search/messages", response_model=MessageSearchResponse, tags=["Search"])
-async def search_messages(
-    query: str = Query(..., min_length=1, description="Search query string"),
-    limit: int = Query(default=20, ge=1, le=100, description="Maximum number of results to return"),
-    channel: Optional[str] = Query(None, description="Filter by specific channel"),
-    date_from: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
-    date_to: Optional[str] = Query(None, description="End date in YYYY-MM-DD format")
+SEARCH_SQL_TEMPLATE = """
+    SELECT 
+        fm.message_id,
+        dc.channel_name,
+        fm.message_date,
+        COALESCE(fm.message_text, '') as message_text,
+        fm.view_count,
+        fm.forward_count,
+        fm.has_image,
+        fm.message_length{count_column}
+    FROM analytics.fct_messages fm
+    JOIN analytics.dim_channels dc ON fm.channel_key = dc.channel_key
+    WHERE {where_clause}
+    ORDER BY fm.message_date DESC, fm.message_id DESC
+    LIMIT :limit
+"""
+
+def _build_search_sql(word_query: bool, has_channel: bool, has_date_from: bool,
+                      has_date_to: bool, has_cursor: bool):
+    """Build the search statement for one combination of filters"""
+    if word_query:
+        conditions = ["fm.message_tsv @@ plainto_tsquery('simple', :search_query)"]
+    else:
+        conditions = ["LOWER(fm.message_text) LIKE :search_query"]
+    if has_channel:
+        conditions.append("dc.channel_name = :channel")
+    if has_date_from:
+        conditions.append("fm.message_date >= :date_from")
+    if has_date_to:
+        conditions.append("fm.message_date <= :date_to")
+    # Seek past the previous page instead of scanning and skipping it. Later pages carry no
+    # window count, which would evaluate every row after the cursor before LIMIT applies;
+    # the total is only counted on the first page, over the unpaged filters
+    if has_cursor:
+        conditions.append("(fm.message_date, fm.message_id) < (:cur_date, :cur_id)")
+        count_column = ""
+    else:
+        count_column = ",\n        COUNT(*) OVER() as total_count"
+    return text(SEARCH_SQL_TEMPLATE.format(where_clause=" AND ".join(conditions), count_column=count_column))
+
+# One prebuilt statement per filter combination, keyed by the _build_search_sql flags
+SEARCH_SQL = {
+    flags: _build_search_sql(*flags)
+    for flags in itertools.product((False, True), repeat=5)
+}
+
+def _encode_cursor(message_date: datetime, message_id: int) -> str:
+    """Encode the last row of a page as an opaque keyset cursor"""
+    payload = json.dumps({"d": message_date.isoformat(), "i": message_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    """Decode a keyset cursor into its (message_date, message_id) position"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["d"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _search_messages(
+    query: str,
+    limit: int,
+    channel: Optional[str],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    cursor: Optional[str] = None
 ):
-    """
-    Searches for messages containing a specific keyword.
+    """Run the message search query and build the response"""
+    position = _decode_cursor(cursor) if cursor else None
     
-    This endpoint performs full-text search across all message content
-    with optional filtering by channel and date range.
-    """
     try:
         # Build query parameters
-        params = {
-            "search_query": f"%{query.lower()}%",
-            "limit": limit
-        }
+        params = {"limit": limit}
         
-        # Build WHERE conditions
-        conditions = ["LOWER(fm.message_text) LIKE %(search_query)s"]
+        # Whole words go through the GIN-indexed tsvector, anything else
+        # falls back to a substring match served by the trigram index
+        word_query = bool(WORD_QUERY_PATTERN.fullmatch(query))
+        if word_query:
+            params["search_query"] = query.lower()
+        else:
+            params["search_query"] = f"%{query.lower()}%"
         
         if channel:
-            conditions.append("dc.channel_name = %(channel)s")
             params["channel"] = channel.lower()
         
         if date_from:
-            conditions.append("fm.message_date >= %(date_from)s")
             params["date_from"] = date_from
         
         if date_to:
-            conditions.append("fm.message_date <= %(date_to)s")
             params["date_to"] = date_to
         
-        where_clause = " AND ".join(conditions)
-        
-        # Search query
-        search_query = f"""
-        SELECT 
-            fm.message_id,
-            dc.channel_name,
-            fm.message_date,
-            fm.message_text,
-            fm.view_count,
-            fm.forward_count,
-            fm.has_image,
-            fm.message_length
-        FROM analytics.fct_messages fm
-        JOIN analytics.dim_channels dc ON fm.channel_key = dc.channel_key
-        WHERE {where_clause}
-        ORDER BY fm.message_date DESC, fm.view_count DESC
-        LIMIT %(limit)s
-        """
-        
-        results = execute_query_to_dataframe(search_query, params)
-        
-        # Convert to response format
-        messages = []
-        for result in results:
-            messages.append(MessageResult(
-                message_id=result['message_id'],
-                channel_name=result['channel_name'],
-                message_date=result['message_date'].isoformat() if result['message_date'] else "",
-                message_text=result['message_text'] or "",
-                view_count=result['view_count'],
-                forward_count=result['forward_count'],
-                has_image=result['has_image'],
-                message_length=result['message_length']
-            ))
-        
-        # Get total count
-        count_query = f"""
-        SELECT COUNT(*) as total_count
-        FROM analytics.fct_messages fm
-        JOIN analytics.dim_channels dc ON fm.channel_key = dc.channel_key
-        WHERE {where_clause}
-        """
-        
-        count_result = execute_query_to_dataframe(count_query, params)
-        total_found = count_result[0]['total_count'] if count_result else 0
-        
-        return MessageSearchResponse(
-            messages=messages,
-            total_found=total_found,
-            query_params={
-                "query": query,
-                "limit": limit,
-                "channel": channel,
-                "date_from": date_from,
-                "date_to": date_to
-            }
+        if position:
+            params["cur_date"], params["cur_id"] = position
+        
+        stmt = SEARCH_SQL[(word_query, bool(channel), bool(date_from), bool(date_to), bool(position))]
+        
+        results = await run_in_threadpool(fetch_mappings, stmt, params)
+        
+        # Only the first page is counted; clients keep that total while following next_cursor
+        if position:
+            total_found = None
+        else:
+            total_found = results[0]['total_count'] if results else 0
+        
+        # A full page means there may be more rows after the last one
+        next_cursor = None
+        if len(results) == limit:
+            last = results[-1]
+            next_cursor = _encode_cursor(last['message_date'], last['message_id'])
+        
+        # Rows already match MessageResult, so they are dumped without building models
+        return Response(
+            content=dump_messages_json(
+                results,
+                total_found=total_found,
+                query_params={
+                    "query": query,
+                    "limit": limit,
+                    "channel": channel,
+                    "date_from": date_from,
+                    "date_to": date_to,
+                    "cursor": cursor
+                },
+                next_cursor=next_cursor
+            ),
+            media_type=JSON_MEDIA_TYPE
         )
         
     except Exception as e:
         logger.error(f"Error in search_messages: {e}")
         raise HTTPException(status_code=500, detail="Failed to search messages")
 
-# Endpoint 4: Visual Content Stats
-@app.get("/api/reports/visual-content", response_model=VisualContentResponse, tags=["Reports"])
-async def get_visual_content_stats(
-    include_details: bool = Query(default=True, description="Whether to include detailed detection stats"),
-    min_confidence: float = Query(default=0.1, ge=0, le=1, description="Minimum confidence threshold for analysis")
+# Short queries are too broad to be worth keeping in the cache
+_search_messages_cached = cache(expire=60, namespace="search")(_search_messages)
+MIN_CACHED_QUERY_LENGTH = 3
+
+@app.get("/api/search/messages", responses={200: {"model": MessageSearchResponse}}, tags=["Search"])
+async def search_messages(
+    query: str = Query(..., min_length=1, description="Search query string"),
+    limit: int = Query(default=20, ge=1, le=100, description="Maximum number of results to return"),
+    channel: Optional[str] = Query(None, description="Filter by specific channel"),
+    date_from: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
+    date_to: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page")
 ):
     """
-    Returns statistics about image usage across channels.
+    Searches for messages containing a specific keyword.
     
-    This endpoint provides comprehensive analytics about visual content,
-    including YOLO object detection results and engagement patterns.
+    This endpoint performs full-text search across all message content
+    with optional filtering by channel and date range.
     """
-    try:
-        params = {"min_confidence": min_confidence}
-        
-        # Get channel visual statistics
-        channel_query = """
+    search = _search_messages_cached if len(query) >= MIN_CACHED_QUERY_LENGTH else _search_messages
+    return await search(
+        query=query,
+        limit=limit,
+        channel=channel,
+        date_from=date_from,
+        date_to=date_to,
+        cursor=cursor
+    )
+
+# Endpoint 4: Visual Content Stats
+# Filter detections once and project every result set from the same CTE
+VISUAL_CONTENT_SQL = text("""
+    WITH filtered_detections AS (
+        SELECT 
+            message_id,
+            channel_key,
+            calculated_category,
+            max_confidence,
+            top_class,
+            top_confidence
+        FROM analytics.fct_image_detections
+        WHERE max_confidence >= :min_confidence
+    ),
+    channel_stats AS (
         SELECT 
             dc.channel_name,
             dc.total_posts,
@@ -460,18 +579,59 @@ async def get_visual_content_stats(
             COUNT(CASE WHEN img.calculated_category = 'lifestyle' THEN 1 END) as lifestyle_posts,
             COALESCE(AVG(img.max_confidence), 0) as avg_confidence
         FROM analytics.dim_channels dc
-        LEFT JOIN analytics.fct_image_detections img ON dc.channel_key = img.channel_key
-            AND img.max_confidence >= %(min_confidence)s
+        JOIN filtered_detections img ON dc.channel_key = img.channel_key
         GROUP BY dc.channel_name, dc.total_posts
-        HAVING COUNT(img.message_id) > 0
-        ORDER BY messages_with_images DESC
-        """
+    ),
+    category_counts AS (
+        SELECT 
+            calculated_category,
+            COUNT(*) as count
+        FROM filtered_detections
+        GROUP BY calculated_category
+    ),
+    top_objects AS (
+        SELECT 
+            top_class,
+            COUNT(*) as detection_count,
+            AVG(top_confidence) as avg_confidence
+        FROM filtered_detections
+        WHERE top_class IS NOT NULL
+        AND :include_details
+        GROUP BY top_class
+        ORDER BY detection_count DESC
+        LIMIT 10
+    )
+    SELECT 
+        (SELECT COALESCE(jsonb_agg(to_jsonb(cs) ORDER BY cs.messages_with_images DESC), '[]'::jsonb)
+         FROM channel_stats cs) as channel_stats,
+        (SELECT COUNT(*) FROM filtered_detections) as total_images_analyzed,
+        (SELECT COALESCE(AVG(max_confidence), 0) FROM filtered_detections) as avg_confidence_score,
+        (SELECT COALESCE(jsonb_object_agg(calculated_category, count), '{}'::jsonb)
+         FROM category_counts) as category_distribution,
+        (SELECT COALESCE(jsonb_agg(to_jsonb(tobj) ORDER BY tobj.detection_count DESC), '[]'::jsonb)
+         FROM top_objects tobj) as top_objects
+""")
+
+@app.get("/api/reports/visual-content", responses={200: {"model": VisualContentResponse}}, tags=["Reports"])
+@cache(expire=300)
+async def get_visual_content_stats(
+    include_details: bool = Query(default=True, description="Whether to include detailed detection stats"),
+    min_confidence: float = Query(default=0.1, ge=0, le=1, description="Minimum confidence threshold for analysis")
+):
+    """
+    Returns statistics about image usage across channels.
+    
+    This endpoint provides comprehensive analytics about visual content,
+    including YOLO object detection results and engagement patterns.
+    """
+    try:
+        params = {"min_confidence": min_confidence, "include_details": include_details}
         
-        channel_results = execute_query_to_dataframe(channel_query, params)
+        payload = (await run_in_threadpool(fetch_mappings, VISUAL_CONTENT_SQL, params))[0]
         
         channel_stats = []
-        for result in channel_results:
-            channel_stats.append(ChannelVisualStats(
+        for result in payload['channel_stats']:
+            channel_stats.append(ChannelVisualStats.model_construct(
                 channel_name=result['channel_name'],
                 total_messages=result['total_posts'],
                 messages_with_images=result['messages_with_images'],
@@ -482,67 +642,26 @@ async def get_visual_content_stats(
                 avg_confidence=round(result['avg_confidence'], 4)
             ))
         
-        # Get overall summary
-        summary_query = """
-        SELECT 
-            COUNT(*) as total_images_analyzed,
-            COALESCE(AVG(max_confidence), 0) as avg_confidence_score
-        FROM analytics.fct_image_detections
-        WHERE max_confidence >= %(min_confidence)s
-        """
-        
-        summary_results = execute_query_to_dataframe(summary_query, params)
-        summary_data = summary_results[0] if summary_results else {}
+        category_distribution = payload['category_distribution']
         
-        # Get category distribution
-        category_query = """
-        SELECT 
-            calculated_category,
-            COUNT(*) as count
-        FROM analytics.fct_image_detections
-        WHERE max_confidence >= %(min_confidence)s
-        GROUP BY calculated_category
-        ORDER BY count DESC
-        """
-        
-        category_results = execute_query_to_dataframe(category_query, params)
-        category_distribution = {result['calculated_category']: result['count'] for result in category_results}
-        
-        # Get top detected objects (if details requested)
-        top_objects = []
-        if include_details:
-            objects_query = """
-            SELECT 
-                top_class,
-                COUNT(*) as detection_count,
-                AVG(top_confidence) as avg_confidence
-            FROM analytics.fct_image_detections
-            WHERE top_class IS NOT NULL 
-            AND max_confidence >= %(min_confidence)s
-            GROUP BY top_class
-            ORDER BY detection_count DESC
-            LIMIT 10
-            """
-            
-            objects_results = execute_query_to_dataframe(objects_query, params)
-            top_objects = [
-                {
-                    "object": result['top_class'],
-                    "count": result['detection_count'],
-                    "avg_confidence": round(result['avg_confidence'], 4)
-                }
-                for result in objects_results
-            ]
+        top_objects = [
+            {
+                "object": result['top_class'],
+                "count": result['detection_count'],
+                "avg_confidence": round(result['avg_confidence'], 4)
+            }
+            for result in payload['top_objects']
+        ]
         
-        return VisualContentResponse(
+        return json_response(VisualContentResponse(
             channel_stats=channel_stats,
             summary=VisualContentSummary(
-                total_images_analyzed=summary_data.get('total_images_analyzed', 0),
-                avg_confidence_score=round(summary_data.get('avg_confidence_score', 0), 4),
+                total_images_analyzed=payload['total_images_analyzed'],
+                avg_confidence_score=round(payload['avg_confidence_score'], 4),
                 top_detected_objects=top_objects
             ),
             category_distribution=category_distribution
-        )
+        ))
         
     except Exception as e:
         logger.error(f"Error in get_visual_content_stats: {e}")
@@ -559,4 +678,14 @@ async def global_exception_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Workers import "main:app" themselves, so each gets its own engine pool and cache backend
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        # The same worker count sizes each worker's connection pool (see database.py)
+        workers=API_WORKERS,
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
\ No newline at end of file
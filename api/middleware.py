@@ -0,0 +1,44 @@
+"""
+HTTP middleware for FastAPI application
+"""
+
+import xxhash
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+class ETagMiddleware(BaseHTTPMiddleware):
+    """Attach ETags to successful GET responses and answer 304 when the client copy is current"""
+    
+    def __init__(self, app, path_prefix: str = "/api/", max_age: int = 60):
+        super().__init__(app)
+        self.path_prefix = path_prefix
+        self.cache_control = f"private, max-age={max_age}, must-revalidate"
+    
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        
+        # Only analytics reads are tagged; health checks and errors pass through untouched
+        if (request.method != "GET"
+                or response.status_code != 200
+                or not request.url.path.startswith(self.path_prefix)):
+            return response
+        
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = f'"{xxhash.xxh64(body).hexdigest()}"'
+        
+        if request.headers.get("if-none-match") == etag:
+            return Response(
+                status_code=304,
+                headers={"ETag": etag, "Cache-Control": self.cache_control}
+            )
+        
+        tagged_response = Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            media_type=response.media_type
+        )
+        tagged_response.headers["ETag"] = etag
+        tagged_response.headers["Cache-Control"] = self.cache_control
+        return tagged_response
@@ -0,0 +1,52 @@
+"""
+Response helpers that serialize payloads straight to JSON bytes with orjson
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+import orjson
+from fastapi_cache.coder import Coder
+from pydantic import BaseModel
+from starlette.responses import Response
+
+JSON_MEDIA_TYPE = "application/json"
+
+def orjson_default(value: Any):
+    """Serialize the database types orjson does not handle natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_response(payload: Any, status_code: int = 200) -> Response:
+    """Serialize a pydantic model (or plain data) and wrap the bytes in a response"""
+    if isinstance(payload, BaseModel):
+        # pydantic-core writes JSON directly, without an intermediate dict
+        content = payload.model_dump_json()
+    else:
+        content = orjson.dumps(payload, default=orjson_default)
+    return Response(
+        content=content,
+        status_code=status_code,
+        media_type=JSON_MEDIA_TYPE
+    )
+
+class JSONBytesCoder(Coder):
+    """Cache coder that stores response bodies as-is and replays them without decoding"""
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, Response):
+            return value.body
+        return orjson.dumps(value, default=orjson_default)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Optional[Any]) -> Any:
+        return Response(content=value, media_type=JSON_MEDIA_TYPE)
@@ -2,13 +2,25 @@
 Pydantic schemas for FastAPI request/response validation
 """
 
-from typing import List, Optional, Dict, Any
+from functools import cache
+from typing import Annotated, List, Optional, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, computed_field
+
+# Rows read from the warehouse are immutable once built; unknown columns are dropped
+ROW_MODEL_CONFIG = ConfigDict(defer_build=False, frozen=True, extra='ignore', validate_assignment=False, populate_by_name=True)
+
+# Reusable constrained types, validated by pydantic-core
+NonNegativeInt = Annotated[int, Field(ge=0)]
+NonNegativeFloat = Annotated[float, Field(ge=0)]
+Percentage = Annotated[float, Field(ge=0, le=100)]
+ConfidenceScore = Annotated[float, Field(ge=0, le=1)]
 
 # Base response schema
 class BaseResponse(BaseModel):
     """Base response schema"""
+    model_config = ConfigDict(defer_build=False)
+
     success: bool = True
     message: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.now)
@@ -16,39 +28,64 @@ class BaseResponse(BaseModel):
 # Product schemas
 class ProductMention(BaseModel):
     """Product mention schema"""
+    model_config = ROW_MODEL_CONFIG
+
     term: str = Field(..., description="Product or term mentioned")
-    mention_count: int = Field(..., ge=0, description="Number of mentions")
-    total_views: int = Field(..., ge=0, description="Total views for messages containing this term")
-    avg_views: float = Field(..., ge=0, description="Average views per message")
+    mention_count: NonNegativeInt = Field(..., description="Number of mentions")
+    total_views: NonNegativeInt = Field(..., description="Total views for messages containing this term")
+    avg_views: NonNegativeFloat = Field(..., description="Average views per message")
     channels: List[str] = Field(default_factory=list, description="Channels where this term was mentioned")
 
 class TopProductsResponse(BaseResponse):
     """Response for top products endpoint"""
     data: List[ProductMention] = Field(..., description="List of top mentioned products")
-    total_analyzed: int = Field(..., ge=0, description="Total messages analyzed")
+    total_analyzed: NonNegativeInt = Field(..., description="Total messages analyzed")
     query_params: Dict[str, Any] = Field(default_factory=dict, description="Query parameters used")
 
 # Channel activity schemas
 class DailyActivity(BaseModel):
     """Daily activity data"""
+    model_config = ROW_MODEL_CONFIG
+
     date: str = Field(..., description="Date in YYYY-MM-DD format")
-    message_count: int = Field(..., ge=0, description="Number of messages posted")
-    total_views: int = Field(..., ge=0, description="Total views for messages on this date")
-    avg_views: float = Field(..., ge=0, description="Average views per message")
-    messages_with_images: int = Field(..., ge=0, description="Number of messages with images")
+    message_count: NonNegativeInt = Field(..., description="Number of messages posted")
+    total_views: NonNegativeInt = Field(..., description="Total views for messages on this date")
+    messages_with_images: NonNegativeInt = Field(..., description="Number of messages with images")
+
+    @computed_field(description="Average views per message")
+    @property
+    def avg_views(self) -> float:
+        return round(self.total_views / self.message_count, 2) if self.message_count else 0.0
 
 class ChannelStats(BaseModel):
     """Channel statistics"""
+    model_config = ConfigDict(defer_build=False)
+
     channel_name: str = Field(..., description="Name of the channel")
     channel_type: Optional[str] = Field(None, description="Type of channel (pharmaceutical, cosmetics, etc.)")
-    total_messages: int = Field(..., ge=0, description="Total messages in channel")
-    avg_daily_posts: float = Field(..., ge=0, description="Average posts per day")
-    total_views: int = Field(..., ge=0, description="Total views across all messages")
-    avg_views_per_post: float = Field(..., ge=0, description="Average views per post")
-    image_percentage: float = Field(..., ge=0, le=100, description="Percentage of posts with images")
+    total_messages: NonNegativeInt = Field(..., description="Total messages in channel")
+    total_views: NonNegativeInt = Field(..., description="Total views across all messages")
+    messages_with_images: NonNegativeInt = Field(..., description="Messages with images")
+    active_days: NonNegativeInt = Field(..., description="Days between first and last post (at least 1)")
     first_post_date: Optional[str] = Field(None, description="Date of first post")
     last_post_date: Optional[str] = Field(None, description="Date of last post")
 
+    # Ratios are derived from the raw counts when the response is serialized
+    @computed_field(description="Average posts per day")
+    @property
+    def avg_daily_posts(self) -> float:
+        return round(self.total_messages / self.active_days, 2) if self.active_days else 0.0
+
+    @computed_field(description="Average views per post")
+    @property
+    def avg_views_per_post(self) -> float:
+        return round(self.total_views / self.total_messages, 2) if self.total_messages else 0.0
+
+    @computed_field(description="Percentage of posts with images")
+    @property
+    def image_percentage(self) -> float:
+        return round(100.0 * self.messages_with_images / self.total_messages, 2) if self.total_messages else 0.0
+
 class ChannelActivityResponse(BaseResponse):
     """Response for channel activity endpoint"""
     channel_info: ChannelStats = Field(..., description="Channel statistics")
@@ -58,37 +95,44 @@ class ChannelActivityResponse(BaseResponse):
 # Message search schemas
 class MessageResult(BaseModel):
     """Single message result"""
+    model_config = ROW_MODEL_CONFIG
+
     message_id: int = Field(..., description="Unique message identifier")
     channel_name: str = Field(..., description="Channel name")
-    message_date: str = Field(..., description="Message date and time")
+    message_date: datetime = Field(..., description="Message date and time")
     message_text: str = Field(..., description="Message text content")
-    view_count: int = Field(..., ge=0, description="Number of views")
-    forward_count: int = Field(..., ge=0, description="Number of forwards")
+    view_count: NonNegativeInt = Field(..., description="Number of views")
+    forward_count: NonNegativeInt = Field(..., description="Number of forwards")
     has_image: bool = Field(..., description="Whether message contains an image")
-    message_length: int = Field(..., ge=0, description="Length of message in characters")
+    message_length: NonNegativeInt = Field(..., description="Length of message in characters")
 
 class MessageSearchResponse(BaseResponse):
     """Response for message search endpoint"""
     messages: List[MessageResult] = Field(..., description="List of matching messages")
-    total_found: int = Field(..., ge=0, description="Total number of messages found")
+    total_found: Optional[NonNegativeInt] = Field(..., description="Total number of messages found; null on pages requested with a cursor")
     query_params: Dict[str, Any] = Field(default_factory=dict, description="Search parameters used")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, absent on the last page")
 
 # Visual content schemas
 class ChannelVisualStats(BaseModel):
     """Visual content statistics for a channel"""
+    model_config = ROW_MODEL_CONFIG
+
     channel_name: str = Field(..., description="Channel name")
-    total_messages: int = Field(..., ge=0, description="Total messages")
-    messages_with_images: int = Field(..., ge=0, description="Messages with images")
-    image_percentage: float = Field(..., ge=0, le=100, description="Percentage of messages with images")
-    promotional_posts: int = Field(..., ge=0, description="Number of promotional posts")
-    product_display_posts: int = Field(..., ge=0, description="Number of product display posts")
-    lifestyle_posts: int = Field(..., ge=0, description="Number of lifestyle posts")
-    avg_confidence: float = Field(..., ge=0, le=1, description="Average detection confidence")
+    total_messages: NonNegativeInt = Field(..., description="Total messages")
+    messages_with_images: NonNegativeInt = Field(..., description="Messages with images")
+    image_percentage: Percentage = Field(..., description="Percentage of messages with images")
+    promotional_posts: NonNegativeInt = Field(..., description="Number of promotional posts")
+    product_display_posts: NonNegativeInt = Field(..., description="Number of product display posts")
+    lifestyle_posts: NonNegativeInt = Field(..., description="Number of lifestyle posts")
+    avg_confidence: ConfidenceScore = Field(..., description="Average detection confidence")
 
 class VisualContentSummary(BaseModel):
     """Summary of visual content across all channels"""
-    total_images_analyzed: int = Field(..., ge=0, description="Total images analyzed")
-    avg_confidence_score: float = Field(..., ge=0, le=1, description="Average confidence across all detections")
+    model_config = ConfigDict(defer_build=False)
+
+    total_images_analyzed: NonNegativeInt = Field(..., description="Total images analyzed")
+    avg_confidence_score: ConfidenceScore = Field(..., description="Average confidence across all detections")
     top_detected_objects: List[Dict[str, Any]] = Field(default_factory=list, description="Most frequently detected objects")
 
 class VisualContentResponse(BaseResponse):
@@ -97,6 +141,11 @@ class VisualContentResponse(BaseResponse):
     summary: VisualContentSummary = Field(..., description="Overall summary")
     category_distribution: Dict[str, int] = Field(default_factory=dict, description="Distribution of image categories")
 
+@cache
+def list_adapter(model_cls):
+    """Return the process-wide TypeAdapter for a list of model_cls, building it on first use"""
+    return TypeAdapter(List[model_cls])
+
 # Error response schema
 class ErrorResponse(BaseResponse):
     """Error response schema"""
@@ -128,4 +177,14 @@ class MessageSearchParams(BaseModel):
 class VisualContentParams(BaseModel):
     """Parameters for visual content endpoint"""
     include_details: bool = Field(default=True, description="Whether to include detailed detection stats")
-    min_confidence: float = Field(default=0.1, ge=0, le=1, description="Minimum confidence threshold for analysis")
\ No newline at end of file
+    min_confidence: float = Field(default=0.1, ge=0, le=1, description="Minimum confidence threshold for analysis")
+
+# Build every validator/serializer at import so each worker's first request doesn't pay for it
+for _model in (BaseResponse, ProductMention, TopProductsResponse, DailyActivity, ChannelStats,
+               ChannelActivityResponse, MessageResult, MessageSearchResponse, ChannelVisualStats,
+               VisualContentSummary, VisualContentResponse, ErrorResponse, TopProductsParams,
+               ChannelActivityParams, MessageSearchParams, VisualContentParams):
+    _model.model_rebuild(force=True)
+
+# Warm the list adapter the endpoints validate rows with
+list_adapter(ProductMention)
@@ -0,0 +1,13 @@
+{{--
+    Incremental filter on scrape time
+    Defaults to rows scraped after the latest one already in the model; pass
+    --vars '{min_scraped_at: "YYYY-MM-DD HH:MM:SS"}' to reprocess from an explicit point
+--}}
+
+{% macro scraped_after_watermark(column='scraped_at') %}
+    {%- if var('min_scraped_at', none) -%}
+        {{ column }} > '{{ var("min_scraped_at") }}'::timestamp
+    {%- else -%}
+        {{ column }} > (select coalesce(max(scraped_at), '1900-01-01'::timestamp) from {{ this }})
+    {%- endif -%}
+{% endmacro %}
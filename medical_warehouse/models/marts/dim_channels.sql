@@ -36,8 +36,9 @@ channel_classification as (
 
 surrogate_keys as (
 
+    -- Hash of the channel name, so keys stored in the incremental facts never shift when channels are added
     select 
-        row_number() over (order by channel_name) as channel_key,
+        ('x' || substr(md5(channel_name), 1, 15))::bit(60)::bigint as channel_key,
         *
     from channel_classification
 
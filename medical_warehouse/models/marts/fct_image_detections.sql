@@ -1,3 +1,12 @@
+{{
+    config(
+        post_hook=[
+            "create index on {{ this }} (channel_key, max_confidence) include (calculated_category, top_class, top_confidence)",
+            "analyze {{ this }}"
+        ]
+    )
+}}
+
 {{--
     Image detections fact table
     Integrates YOLO object detection results with message data
@@ -0,0 +1,83 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['message_id', 'channel_key'],
+        incremental_strategy='delete+insert',
+        on_schema_change='sync_all_columns',
+        indexes=[
+            {'columns': ['term']},
+            {'columns': ['channel_key', 'message_date']}
+        ]
+    )
+}}
+
+{{--
+    Message terms fact table
+    One row per (message, term) with terms tokenized, lowercased and stopword-filtered once at build time
+    Incremental: only messages scraped since the last build are re-tokenized
+--}}
+
+with messages as (
+
+    select 
+        fct_messages.message_id,
+        fct_messages.channel_key,
+        dim_channels.channel_name,
+        fct_messages.message_date,
+        fct_messages.view_count,
+        fct_messages.message_text,
+        fct_messages.scraped_at
+    from {{ ref('fct_messages') }} fct_messages
+    left join {{ ref('dim_channels') }} dim_channels
+        on fct_messages.channel_key = dim_channels.channel_key
+    where fct_messages.message_text is not null
+    and length(fct_messages.message_text) > 0
+    {% if is_incremental() %}
+    and {{ scraped_after_watermark('fct_messages.scraped_at') }}
+    {% endif %}
+
+),
+
+message_terms as (
+
+    select 
+        message_id,
+        channel_key,
+        channel_name,
+        message_date,
+        view_count,
+        scraped_at,
+        regexp_split_to_table(lower(message_text), '[\s.,;:!?()]+') as term
+    from messages
+
+),
+
+filtered_terms as (
+
+    -- Hash anti-join against the stopword lookup
+    select message_terms.*
+    from message_terms
+    left join {{ ref('dim_stopwords') }} dim_stopwords
+        on message_terms.term = dim_stopwords.term
+    where length(message_terms.term) >= 3
+    and dim_stopwords.term is null
+
+)
+
+select 
+    filtered_terms.message_id,
+    filtered_terms.channel_key,
+    filtered_terms.channel_name,
+    filtered_terms.message_date,
+    filtered_terms.view_count,
+    filtered_terms.term,
+    filtered_terms.scraped_at,
+    -- Flag likely medical/product terms: exact lookup first, alphanumeric pattern for the rest
+    case 
+        when dim_medical_terms.term is not null then true
+        when filtered_terms.term ~ any(array['[a-z]+[0-9]+', '[0-9]+[a-z]+']) then true
+        else false
+    end as is_medical_term
+from filtered_terms
+left join {{ ref('dim_medical_terms') }} dim_medical_terms
+    on filtered_terms.term = dim_medical_terms.term
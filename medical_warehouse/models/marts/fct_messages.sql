@@ -1,6 +1,26 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['message_id', 'channel_key'],
+        on_schema_change='sync_all_columns',
+        indexes=[
+            {'columns': ['message_tsv'], 'type': 'gin'},
+            {'columns': ['lower(message_text) gin_trgm_ops'], 'type': 'gin'}
+        ],
+        post_hook=[
+            "create index if not exists {{ this.name }}_channel_date_idx on {{ this }} (channel_key, message_date desc) include (view_count, has_image, message_length)",
+            "create index if not exists {{ this.name }}_date_key_idx on {{ this }} (date_key) include (view_count, has_image)",
+            "create index if not exists {{ this.name }}_date_id_idx on {{ this }} (message_date desc, message_id desc)",
+            "create index if not exists {{ this.name }}_scraped_at_idx on {{ this }} (scraped_at)",
+            "analyze {{ this }}"
+        ]
+    )
+}}
+
 {{--
     Messages fact table
     One row per message with foreign keys to dimension tables
+    Incremental: each run only merges messages scraped since the last build
 --}}
 
 with messages as (
@@ -18,6 +38,9 @@ with messages as (
         scraped_at,
         message_date_only
     from {{ ref('stg_telegram_messages') }}
+    {% if is_incremental() %}
+    where {{ scraped_after_watermark() }}
+    {% endif %}
 
 ),
 
@@ -54,5 +77,7 @@ select
     has_image,
     has_media,
     scraped_at,
-    message_date_only as message_date
+    message_date_only as message_date,
+    -- Full-text search vector for the API message search
+    to_tsvector('simple', coalesce(message_text, '')) as message_tsv
 from join_dates
@@ -0,0 +1,66 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='message_date',
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['message_date', 'mention_count desc']},
+            {'columns': ['term']}
+        ]
+    )
+}}
+
+{{--
+    Daily medical term mart
+    Pre-aggregated term mentions per day so the top products report reads a small table
+    Incremental: every day that received terms scraped since the last build is re-aggregated in full
+--}}
+
+with medical_terms as (
+
+    select 
+        message_date,
+        term,
+        channel_name,
+        view_count,
+        scraped_at
+    from {{ ref('fct_message_terms') }}
+    where is_medical_term
+    {% if is_incremental() %}
+    -- Backfills and late rows can land on any day, not just the newest, so re-aggregate each touched day
+    and message_date in (
+        select message_date
+        from {{ ref('fct_message_terms') }}
+        where is_medical_term
+        and {{ scraped_after_watermark() }}
+    )
+    {% endif %}
+
+),
+
+-- Group by channel first so the channel list needs no per-group distinct sort
+term_channels as (
+
+    select 
+        message_date,
+        term,
+        channel_name,
+        count(*) as mention_count,
+        sum(view_count) as total_views,
+        max(scraped_at) as scraped_at
+    from medical_terms
+    group by message_date, term, channel_name
+
+)
+
+select 
+    message_date,
+    term,
+    sum(mention_count)::bigint as mention_count,
+    sum(total_views)::bigint as total_views,
+    sum(total_views)::numeric / sum(mention_count) as avg_views,
+    array_agg(channel_name) as channels,
+    max(scraped_at) as scraped_at
+from term_channels
+group by message_date, term
@@ -3,31 +3,97 @@
 Pipeline monitoring and alerting for Ethiopian Medical Business Data Platform
 """
 
+import asyncio
+import atexit
+import functools
 import os
+import queue
 import sys
-import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import orjson
 import requests
-from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+import operator
+from string import Formatter
+from dataclasses import dataclass, field
+
+# fromisoformat accepts a trailing 'Z' from Python 3.11; older interpreters use the C parser
+if sys.version_info >= (3, 11):
+    _parse_iso = datetime.fromisoformat
+else:
+    from ciso8601 import parse_datetime as _parse_iso
 
 # Add src directory to path
 sys.path.append(str(Path(__file__).parent / 'src'))
 
-# Configure logging
+# File locations, resolved once; output directories are created at import
+ALERTS_CONFIG_PATH = Path("pipeline_alerts.json")
+MONITORING_LOG_PATH = Path("logs/pipeline_monitoring.log")
+ALERTS_LOG_PATH = Path("logs/alerts.log")
+REPORT_PATH = Path("results/monitoring_report.json")
+ALERTS_LOG_PATH.parent.mkdir(exist_ok=True)
+REPORT_PATH.parent.mkdir(exist_ok=True)
+
+# Configure logging: records are formatted on the calling thread and written by a listener thread
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler(MONITORING_LOG_PATH),
+    logging.StreamHandler()
+)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/pipeline_monitoring.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+RECENT_RUNS_QUERY = """
+query GetRecentRuns($jobName: String!, $limit: Int!) {
+  runsOrError(limit: $limit, filter: {jobName: $jobName}) {
+    __typename
+    ... on Runs {
+      results {
+        id
+        status
+        startTime
+        endTime
+      }
+    }
+    ... on PythonError {
+      message
+    }
+  }
+}
+"""
+
+COMPARISONS = {'gt': operator.gt, 'lt': operator.lt, 'eq': operator.eq}
+
+def _escape_braces(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+def bake_threshold(template: str, threshold: float) -> str:
+    """Render the constant {threshold} fields of a message template ahead of time"""
+    parts = []
+    for literal, field_name, format_spec, conversion in Formatter().parse(template):
+        parts.append(_escape_braces(literal))
+        if field_name is None:
+            continue
+        if field_name == 'threshold':
+            parts.append(_escape_braces(format(threshold, format_spec)))
+        else:
+            parts.append('{' + field_name
+                         + (f'!{conversion}' if conversion else '')
+                         + (f':{format_spec}' if format_spec else '') + '}')
+    return ''.join(parts)
+
+@dataclass(slots=True, frozen=True)
 class PipelineAlert:
     """Pipeline alert configuration"""
     alert_type: str
@@ -35,6 +101,54 @@ class PipelineAlert:
     comparison: str  # 'gt', 'lt', 'eq'
     message_template: str
     severity: str  # 'info', 'warning', 'error', 'critical'
+    check: Callable[[float], bool] = field(init=False, repr=False, compare=False)
+    template: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Bind the comparison operator and threshold once, at load time
+        if self.comparison not in COMPARISONS:
+            raise ValueError(f"Unknown comparison {self.comparison!r} for alert {self.alert_type!r}")
+        compare, threshold = COMPARISONS[self.comparison], self.threshold
+        object.__setattr__(self, 'check', lambda value: compare(value, threshold))
+        object.__setattr__(self, 'template', bake_threshold(self.message_template, threshold))
+
+AlertHandler = Callable[[PipelineAlert, Dict[str, Any], Dict[str, Any]], Tuple[bool, Dict[str, Any]]]
+
+def _check_pipeline_failure(alert: PipelineAlert, pipeline_stats: Dict[str, Any], data_stats: Dict[str, Any]):
+    """Trigger when the most recent run failed"""
+    status = pipeline_stats.get('last_status')
+    if status == 'FAILURE':
+        return True, {'status': status}
+    return False, {}
+
+def _threshold_check(source: str, stat_key: str, data_key: str) -> AlertHandler:
+    """Build a handler comparing one pipeline or data statistic against the alert threshold"""
+    def handler(alert: PipelineAlert, pipeline_stats: Dict[str, Any], data_stats: Dict[str, Any]):
+        value = (pipeline_stats if source == 'pipeline' else data_stats).get(stat_key, 0)
+        if alert.check(value):
+            return True, {data_key: value, 'threshold': alert.threshold}
+        return False, {}
+    return handler
+
+ALERT_HANDLERS: Dict[str, AlertHandler] = {
+    "pipeline_failure": _check_pipeline_failure,
+    "long_execution_time": _threshold_check('pipeline', 'max_execution_time', 'execution_time'),
+    "low_data_volume": _threshold_check('data', 'total_messages', 'records_processed'),
+    "high_failure_rate": _threshold_check('pipeline', 'failure_rate', 'failure_rate'),
+    "stale_data": _threshold_check('pipeline', 'hours_since_last_run', 'hours_since_last_run')
+}
+
+@functools.lru_cache(maxsize=4)
+def _load_alerts_cached(path: str, mtime_ns: int) -> Tuple[PipelineAlert, ...]:
+    """Parse an alerts file; keyed on mtime so edits to the file are picked up"""
+    alerts = []
+    for alert_data in orjson.loads(Path(path).read_bytes()):
+        # One malformed entry is skipped rather than disabling every alert
+        try:
+            alerts.append(PipelineAlert(**alert_data))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Skipping invalid alert {alert_data!r}: {e}")
+    return tuple(alerts)
 
 class PipelineMonitor:
     """Monitor pipeline execution and send alerts"""
@@ -43,8 +157,16 @@ class PipelineMonitor:
         """Initialize pipeline monitor"""
         self.dagster_url = "http://localhost:3000"
         self.api_url = f"{self.dagster_url}/graphql"
-        self.alerts_file = Path("pipeline_alerts.json")
-        self.monitoring_log = Path("logs/pipeline_monitoring.log")
+        self.alerts_file = ALERTS_CONFIG_PATH
+        self.monitoring_log = MONITORING_LOG_PATH
+        
+        # Alerts are appended through one long-lived buffered handle
+        self._alerts_fh = open(ALERTS_LOG_PATH, 'a', buffering=8192)
+        
+        # Keep-alive session so polling reuses connections to Dagster
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
         
         # Create alerts file if it doesn't exist
         self.setup_default_alerts()
@@ -93,38 +215,30 @@ class PipelineMonitor:
                 }
             ]
             
-            with open(self.alerts_file, 'w') as f:
-                json.dump(default_alerts, f, indent=2)
+            self.alerts_file.write_bytes(orjson.dumps(default_alerts, option=orjson.OPT_INDENT_2))
             
             logger.info(f"Created default alerts configuration: {self.alerts_file}")
     
-    def load_alerts(self) -> List[PipelineAlert]:
+    def load_alerts(self) -> Tuple[PipelineAlert, ...]:
         """Load alert configurations"""
         try:
-            with open(self.alerts_file, 'r') as f:
-                alerts_data = json.load(f)
-            
-            alerts = []
-            for alert_data in alerts_data:
-                alerts.append(PipelineAlert(**alert_data))
-            
-            return alerts
+            return _load_alerts_cached(str(self.alerts_file), self.alerts_file.stat().st_mtime_ns)
         except Exception as e:
             logger.error(f"Failed to load alerts: {e}")
-            return []
+            return ()
     
     def query_dagster_graphql(self, query: str, variables: Dict[str, Any] = None) -> Dict[str, Any]:
         """Query Dagster GraphQL API"""
         try:
-            response = requests.post(
+            response = self._session.post(
                 self.api_url,
-                json={"query": query, "variables": variables or {}},
+                data=orjson.dumps({"query": query, "variables": variables or {}}),
                 headers={"Content-Type": "application/json"},
                 timeout=30
             )
             
             if response.status_code == 200:
-                return response.json()
+                return orjson.loads(response.content)
             else:
                 logger.error(f"GraphQL query failed: {response.status_code} - {response.text}")
                 return {}
@@ -135,33 +249,8 @@ class PipelineMonitor:
     
     def get_recent_runs(self, job_name: str = "ethiopian_medical_pipeline", limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent pipeline runs"""
-        query = """
-        query GetRecentRuns($jobName: String!, $limit: Int!) {
-          runsOrError(limit: $limit, filter: {jobName: $jobName}) {
-            __typename
-            ... on Runs {
-              results {
-                id
-                status
-                startTime
-                endTime
-                runConfigYaml
-                logs {
-                  timestamp
-                  message
-                  level
-                }
-              }
-            }
-            ... on PythonError {
-              message
-            }
-          }
-        }
-        """
-        
         variables = {"jobName": job_name, "limit": limit}
-        result = self.query_dagster_graphql(query, variables)
+        result = self.query_dagster_graphql(RECENT_RUNS_QUERY, variables)
         
         if result and 'data' in result and 'runsOrError' in result['data']:
             runs_data = result['data']['runsOrError']
@@ -177,18 +266,21 @@ class PipelineMonitor:
         if not runs:
             return {}
         
-        # Calculate statistics
+        # Count outcomes and collect execution times in a single pass
         total_runs = len(runs)
-        successful_runs = len([r for r in runs if r.get('status') == 'SUCCESS'])
-        failed_runs = len([r for r in runs if r.get('status') == 'FAILURE'])
-        
-        # Calculate execution times
+        successful_runs = 0
+        failed_runs = 0
         execution_times = []
         for run in runs:
-            if run.get('startTime') and run.get('endTime'):
-                start_time = datetime.fromisoformat(run['startTime'].replace('Z', '+00:00'))
-                end_time = datetime.fromisoformat(run['endTime'].replace('Z', '+00:00'))
-                execution_time = (end_time - start_time).total_seconds()
+            status = run.get('status')
+            if status == 'SUCCESS':
+                successful_runs += 1
+            elif status == 'FAILURE':
+                failed_runs += 1
+            
+            start, end = run.get('startTime'), run.get('endTime')
+            if start and end:
+                execution_time = (_parse_iso(end) - _parse_iso(start)).total_seconds()
                 execution_times.append(execution_time)
         
         avg_execution_time = sum(execution_times) / len(execution_times) if execution_times else 0
@@ -198,7 +290,7 @@ class PipelineMonitor:
         last_run = runs[0] if runs else None
         hours_since_last_run = 0
         if last_run and last_run.get('startTime'):
-            last_run_time = datetime.fromisoformat(last_run['startTime'].replace('Z', '+00:00'))
+            last_run_time = _parse_iso(last_run['startTime'])
             hours_since_last_run = (datetime.now(last_run_time.tzinfo) - last_run_time).total_seconds() / 3600
         
         return {
@@ -217,47 +309,39 @@ class PipelineMonitor:
     def get_data_volume_stats(self) -> Dict[str, Any]:
         """Get data volume statistics from database"""
         try:
-            from database import execute_query_to_dataframe
-            
-            # Get message count
-            message_query = """
-            SELECT 
-                COUNT(*) as total_messages,
-                COUNT(DISTINCT channel_name) as unique_channels,
-                MIN(message_date) as earliest_message,
-                MAX(message_date) as latest_message
-            FROM analytics.fct_messages
-            """
+            from database import fetch_mappings
             
-            message_stats = execute_query_to_dataframe(message_query)
-            
-            # Get image detection stats
-            image_query = """
-            SELECT 
-                COUNT(*) as total_images,
-                AVG(max_confidence) as avg_confidence,
-                COUNT(DISTINCT calculated_category) as unique_categories
-            FROM analytics.fct_image_detections
+            # Message and image detection stats in one round-trip
+            volume_query = """
+            WITH message_stats AS (
+                SELECT 
+                    COUNT(*) as total_messages,
+                    COUNT(DISTINCT channel_name) as unique_channels,
+                    MIN(message_date) as earliest_message,
+                    MAX(message_date) as latest_message
+                FROM analytics.fct_messages
+            ),
+            image_stats AS (
+                SELECT 
+                    COUNT(*) as total_images,
+                    AVG(max_confidence) as avg_confidence,
+                    COUNT(DISTINCT calculated_category) as unique_categories
+                FROM analytics.fct_image_detections
+            )
+            SELECT * FROM message_stats CROSS JOIN image_stats
             """
             
-            image_stats = execute_query_to_dataframe(image_query)
-            
-            stats = {}
-            
-            if message_stats:
-                stats.update({
-                    'total_messages': message_stats[0]['total_messages'],
-                    'unique_channels': message_stats[0]['unique_channels'],
-                    'earliest_message': str(message_stats[0]['earliest_message']),
-                    'latest_message': str(message_stats[0]['latest_message'])
-                })
+            row = fetch_mappings(volume_query)[0]
             
-            if image_stats:
-                stats.update({
-                    'total_images': image_stats[0]['total_images'],
-                    'avg_confidence': float(image_stats[0]['avg_confidence']) if image_stats[0]['avg_confidence'] else 0,
-                    'unique_categories': image_stats[0]['unique_categories']
-                })
+            stats = {
+                'total_messages': row['total_messages'],
+                'unique_channels': row['unique_channels'],
+                'earliest_message': str(row['earliest_message']),
+                'latest_message': str(row['latest_message']),
+                'total_images': row['total_images'],
+                'avg_confidence': float(row['avg_confidence']) if row['avg_confidence'] else 0,
+                'unique_categories': row['unique_categories']
+            }
             
             return stats
             
@@ -270,44 +354,14 @@ class PipelineMonitor:
         triggered_alerts = []
         
         for alert in self.alerts:
-            triggered = False
-            alert_data = {}
-            
-            if alert.alert_type == "pipeline_failure":
-                if pipeline_stats.get('last_status') == 'FAILURE':
-                    triggered = True
-                    alert_data['status'] = pipeline_stats['last_status']
-            
-            elif alert.alert_type == "long_execution_time":
-                execution_time = pipeline_stats.get('max_execution_time', 0)
-                if alert.comparison == 'gt' and execution_time > alert.threshold:
-                    triggered = True
-                    alert_data['execution_time'] = execution_time
-                    alert_data['threshold'] = alert.threshold
-            
-            elif alert.alert_type == "low_data_volume":
-                total_messages = data_stats.get('total_messages', 0)
-                if alert.comparison == 'lt' and total_messages < alert.threshold:
-                    triggered = True
-                    alert_data['records_processed'] = total_messages
-                    alert_data['threshold'] = alert.threshold
-            
-            elif alert.alert_type == "high_failure_rate":
-                failure_rate = pipeline_stats.get('failure_rate', 0)
-                if alert.comparison == 'gt' and failure_rate > alert.threshold:
-                    triggered = True
-                    alert_data['failure_rate'] = failure_rate
-                    alert_data['threshold'] = alert.threshold
+            handler = ALERT_HANDLERS.get(alert.alert_type)
+            if handler is None:
+                continue
             
-            elif alert.alert_type == "stale_data":
-                hours_since_last_run = pipeline_stats.get('hours_since_last_run', 0)
-                if alert.comparison == 'gt' and hours_since_last_run > alert.threshold:
-                    triggered = True
-                    alert_data['hours_since_last_run'] = hours_since_last_run
-                    alert_data['threshold'] = alert.threshold
+            triggered, alert_data = handler(alert, pipeline_stats, data_stats)
             
             if triggered:
-                message = alert.message_template.format(**alert_data)
+                message = alert.template.format_map(alert_data)
                 triggered_alerts.append({
                     'alert_type': alert.alert_type,
                     'severity': alert.severity,
@@ -345,21 +399,24 @@ class PipelineMonitor:
             logger.info(log_message)
         
         # Store alert in alerts file
-        alerts_log = Path("logs/alerts.log")
-        with open(alerts_log, 'a') as f:
-            f.write(f"{datetime.now().isoformat()} - {log_message}\n")
+        self._alerts_fh.write(f"{datetime.now().isoformat()} - {log_message}\n")
     
-    def run_monitoring(self):
+    def close(self):
+        """Flush buffered alerts and release the Dagster session"""
+        self._alerts_fh.close()
+        self._session.close()
+    
+    async def run_monitoring(self):
         """Run complete monitoring cycle"""
         logger.info("Starting pipeline monitoring...")
         
         try:
-            # Get pipeline statistics
-            pipeline_stats = self.get_pipeline_stats()
+            # Dagster and database stats are independent, so fetch them concurrently
+            pipeline_stats, data_stats = await asyncio.gather(
+                asyncio.to_thread(self.get_pipeline_stats),
+                asyncio.to_thread(self.get_data_volume_stats)
+            )
             logger.info(f"Pipeline stats: {pipeline_stats}")
-            
-            # Get data statistics
-            data_stats = self.get_data_volume_stats()
             logger.info(f"Data stats: {data_stats}")
             
             # Check alerts
@@ -394,13 +451,9 @@ class PipelineMonitor:
         }
         
         # Save report
-        report_file = Path("results/monitoring_report.json")
-        report_file.parent.mkdir(exist_ok=True)
+        REPORT_PATH.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC))
         
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2, default=str)
-        
-        logger.info(f"Monitoring report saved to {report_file}")
+        logger.info(f"Monitoring report saved to {REPORT_PATH}")
         
         return report
 
@@ -409,7 +462,7 @@ def main():
     monitor = PipelineMonitor()
     
     try:
-        monitor.run_monitoring()
+        asyncio.run(monitor.run_monitoring())
         
         # Print summary
         print("\n=== Pipeline Monitoring Summary ===")
@@ -420,6 +473,9 @@ def main():
     except Exception as e:
         logger.error(f"Monitoring failed: {e}")
         print(f"Error: {e}")
+    
+    finally:
+        monitor.close()
 
 if __name__ == "__main__":
     main()
@@ -3,28 +3,79 @@ Dagster pipeline for Ethiopian Medical Business Data Platform
 Orchestrates the complete data pipeline from scraping to enrichment
 """
 
+import asyncio
+import functools
 import os
 import sys
-import subprocess
+import json
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from dagster import (
-    job, op, Out, In, graph,
+    job, op, Out, In, Output, graph,
     AssetMaterialization, ExpectationResult,
     OpExecutionContext, DagsterRunConfig,
-    materialize, MetadataValue
+    materialize, MetadataValue, multiprocess_executor,
+    in_process_executor, resource, Nothing
 )
 
 # Add src directory to path for imports
 sys.path.append(str(Path(__file__).parent / 'src'))
 
+# The src modules attach file log handlers under logs/ when imported
+Path('logs').mkdir(exist_ok=True)
+
+# Imported once per worker rather than inside every op run. yolo_detect stays
+# deferred to load_yolo_detector so ops that don't need torch never load it.
+from dbt.cli.main import dbtRunner
+from scraper import TelegramScraper
+from load_to_postgres import PostgresDataLoader
+from load_yolo_results import YOLOResultsLoader
+from analyze_image_patterns import ImagePatternAnalyzer
+from utils import iter_image_files
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# dbt events that report a finished node; logged as they arrive for live progress
+DBT_RESULT_EVENTS = {'LogSeedResult', 'LogModelResult', 'LogTestResult'}
+
+# dbt project location
+DBT_PROJECT_DIR = Path(__file__).parent / 'medical_warehouse'
+
+def dbt_project_args() -> List[str]:
+    """Project, profiles and backfill arguments shared by every dbt invocation"""
+    project_args = ['--project-dir', str(DBT_PROJECT_DIR)]
+    
+    # Resolve a project-local profiles.yml explicitly instead of relying on the working directory
+    if not os.getenv('DBT_PROFILES_DIR') and (DBT_PROJECT_DIR / 'profiles.yml').exists():
+        project_args += ['--profiles-dir', str(DBT_PROJECT_DIR)]
+    
+    # Incremental models default to their own scraped_at watermark; allow an explicit backfill point
+    min_scraped_at = os.getenv('DBT_MIN_SCRAPED_AT')
+    if min_scraped_at:
+        project_args += ['--vars', json.dumps({'min_scraped_at': min_scraped_at})]
+    return project_args
+
+# Load messages into PostgreSQL while scraping instead of re-reading the JSON afterwards
+STREAM_TO_POSTGRES = os.getenv('STREAM_TO_POSTGRES', 'false').lower() == 'true'
+
+@functools.lru_cache(maxsize=1)
+def load_yolo_detector():
+    """Build the YOLO detector once per process, with its model fused (and compiled on CUDA) for inference"""
+    from yolo_detect import YOLODetector
+    
+    detector = YOLODetector()
+    detector.prepare_model()
+    return detector
+
+@resource(description="YOLO detector with model weights loaded once per worker process")
+def yolo_detector_resource(_):
+    return load_yolo_detector()
+
 # Op 1: Scrape Telegram Data
 @op(
     description="Scrape Telegram messages and images from Ethiopian medical channels",
@@ -44,21 +95,11 @@ def scrape_telegram_data(context: OpExecutionContext) -> str:
     try:
         context.log.info("Starting Telegram data scraping...")
         
-        # Import and run scraper
-        from scraper import TelegramScraper
-        
         scraper = TelegramScraper()
         
-        # Run scraping with error handling
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Scrape with a reasonable limit for daily runs
-            limit_per_channel = 500  # Adjust based on needs
-            loop.run_until_complete(scraper.scrape_all_channels(limit_per_channel=limit_per_channel))
-        finally:
-            loop.close()
+        # Scrape with a reasonable limit for daily runs
+        limit_per_channel = 500  # Adjust based on needs
+        asyncio.run(scraper.scrape_all_channels(limit_per_channel=limit_per_channel))
         
         # Get data path
         raw_data_path = Path(os.getenv('RAW_DATA_PATH', 'data/raw'))
@@ -104,9 +145,6 @@ def load_raw_to_postgres(context: OpExecutionContext, data_path: str) -> int:
     try:
         context.log.info(f"Loading raw data from: {data_path}")
         
-        # Import and run loader
-        from load_to_postgres import PostgresDataLoader
-        
         loader = PostgresDataLoader()
         
         # Load data
@@ -139,6 +177,66 @@ def load_raw_to_postgres(context: OpExecutionContext, data_path: str) -> int:
         context.log.error(f"Data loading failed: {e}")
         raise
 
+# Op 1+2 (streaming): Scrape and load in one pass
+@op(
+    description="Scrape Telegram data and stream messages into PostgreSQL as they arrive",
+    out={
+        "data_path": Out(description="Path to scraped data directory"),
+        "records_loaded": Out(description="Number of records loaded"),
+    },
+)
+def scrape_and_stream_to_postgres(context: OpExecutionContext):
+    """
+    Scrape Telegram channels and load messages into PostgreSQL in the same process.
+    
+    Parsed messages are queued to a COPY consumer as they are scraped, so the
+    raw table fills during the scrape; the partitioned JSON files are still
+    written as a checkpoint for replays with load_raw_to_postgres.
+    """
+    try:
+        context.log.info("Starting streaming Telegram scrape and load...")
+        
+        scraper = TelegramScraper()
+        loader = PostgresDataLoader()
+        loader.create_raw_schema()
+        
+        limit_per_channel = 500  # Adjust based on needs
+        
+        async def scrape_and_copy() -> int:
+            message_queue = asyncio.Queue()
+            copier = asyncio.create_task(loader.copy_from_queue(message_queue))
+            try:
+                await scraper.scrape_all_channels(limit_per_channel=limit_per_channel, message_queue=message_queue)
+            finally:
+                await message_queue.put(None)
+            return await copier
+        
+        total_loaded = asyncio.run(scrape_and_copy())
+        stats = loader.get_loading_stats()
+        raw_data_path = Path(os.getenv('RAW_DATA_PATH', 'data/raw'))
+        
+        context.log.info(f"Streaming load completed. Records loaded: {total_loaded}")
+        
+        context.log_event(
+            AssetMaterialization(
+                asset_key="raw_database",
+                description="Telegram messages streamed to PostgreSQL",
+                metadata={
+                    "records_loaded": total_loaded,
+                    "channels_scraped": scraper.channels,
+                    "unique_channels": stats.get('unique_channels', 0),
+                    "timestamp": datetime.now().isoformat()
+                }
+            )
+        )
+        
+        yield Output(str(raw_data_path), "data_path")
+        yield Output(total_loaded, "records_loaded")
+        
+    except Exception as e:
+        context.log.error(f"Streaming scrape and load failed: {e}")
+        raise
+
 # Op 3: Run dbt Transformations
 @op(
     description="Execute dbt transformations to build the data warehouse",
@@ -158,78 +256,60 @@ def run_dbt_transformations(context: OpExecutionContext, records_loaded: int) ->
     try:
         context.log.info(f"Running dbt transformations for {records_loaded} records...")
         
-        # Change to medical_warehouse directory
-        dbt_dir = Path(__file__).parent / 'medical_warehouse'
-        original_dir = os.getcwd()
+        project_args = dbt_project_args()
         
-        try:
-            os.chdir(dbt_dir)
-            context.log.info(f"Changed to directory: {dbt_dir}")
-            
-            # Run dbt commands
-            commands = [
-                ['dbt', 'run'],
-                ['dbt', 'test']
-            ]
-            
-            results = {}
-            
-            for cmd in commands:
-                context.log.info(f"Running: {' '.join(cmd)}")
-                
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=300  # 5 minute timeout
-                )
-                
-                cmd_name = ' '.join(cmd)
-                results[cmd_name] = {
-                    'return_code': result.returncode,
-                    'stdout': result.stdout,
-                    'stderr': result.stderr
-                }
-                
-                if result.returncode != 0:
-                    context.log.error(f"dbt command failed: {cmd_name}")
-                    context.log.error(f"stderr: {result.stderr}")
-                    raise Exception(f"dbt {cmd_name} failed with return code {result.returncode}")
-                
-                context.log.info(f"dbt {cmd_name} completed successfully")
-            
-            # Parse results for summary
-            run_output = results.get('dbt run', {}).get('stdout', '')
-            test_output = results.get('dbt test', {}).get('stdout', '')
+        # Parse the project once and share the manifest across seed, run and test
+        parse_result = dbtRunner().invoke(['parse', *project_args])
+        if not parse_result.success:
+            raise Exception(f"dbt parse failed: {parse_result.exception}")
+        
+        def log_dbt_progress(event):
+            # Structured events stream in as each node finishes, instead of after the whole command
+            if event.info.name in DBT_RESULT_EVENTS:
+                context.log.info(event.info.msg)
+        
+        runner = dbtRunner(manifest=parse_result.result, callbacks=[log_dbt_progress])
+        results = {}
+        
+        for command in ['seed', 'run', 'test']:
+            context.log.info(f"Running: dbt {command}")
             
-            # Extract key metrics
-            summary = {
-                'run_success': results['dbt run']['return_code'] == 0,
-                'test_success': results['dbt test']['return_code'] == 0,
-                'run_output': run_output,
-                'test_output': test_output,
-                'timestamp': datetime.now().isoformat()
-            }
+            result = runner.invoke([command, *project_args])
+            results[command] = result
             
-            context.log.info("dbt transformations completed successfully")
+            if not result.success:
+                context.log.error(f"dbt command failed: {command}")
+                raise Exception(f"dbt {command} failed: {result.exception or 'see dbt logs'}")
             
-            # Create asset materialization
-            context.log_event(
-                AssetMaterialization(
-                    asset_key="data_warehouse",
-                    description="dbt transformations completed",
-                    metadata=summary
-                )
+            context.log.info(f"dbt {command} completed successfully")
+        
+        # Summarize from the structured run results
+        run_results = results['run'].result.results
+        test_results = results['test'].result.results
+        summary = {
+            'run_success': results['run'].success,
+            'test_success': results['test'].success,
+            'models_built': len(run_results),
+            'tests_run': len(test_results),
+            'tests_passed': sum(1 for r in test_results if str(r.status) == 'pass'),
+            'run_elapsed_seconds': round(sum(r.execution_time for r in run_results), 2),
+            'model_timings': {r.node.name: round(r.execution_time, 2) for r in run_results},
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        context.log.info("dbt transformations completed successfully")
+        
+        # Create asset materialization
+        context.log_event(
+            AssetMaterialization(
+                asset_key="data_warehouse",
+                description="dbt transformations completed",
+                metadata=summary
             )
-            
-            return summary
-            
-        finally:
-            os.chdir(original_dir)
+        )
+        
+        return summary
         
-    except subprocess.TimeoutExpired:
-        context.log.error("dbt operation timed out")
-        raise
     except Exception as e:
         context.log.error(f"dbt transformations failed: {e}")
         raise
@@ -237,10 +317,11 @@ def run_dbt_transformations(context: OpExecutionContext, records_loaded: int) ->
 # Op 4: Run YOLO Enrichment
 @op(
     description="Run YOLO object detection on downloaded images",
-    ins={"dbt_results": In(description="dbt transformation results")},
+    ins={"scraped_data": In(description="Path to scraped data (images live under images/)")},
     out=Out(description="YOLO enrichment results"),
+    required_resource_keys={"yolo"},
 )
-def run_yolo_enrichment(context: OpExecutionContext, dbt_results: Dict[str, Any]) -> Dict[str, Any]:
+def run_yolo_enrichment(context: OpExecutionContext, scraped_data: str) -> Dict[str, Any]:
     """
     Run YOLO object detection on downloaded images to enrich the data warehouse.
     
@@ -248,59 +329,47 @@ def run_yolo_enrichment(context: OpExecutionContext, dbt_results: Dict[str, Any]
     - Processes downloaded images with YOLOv8
     - Classifies image content (promotional, product_display, etc.)
     - Loads results to database
-    - Generates analytical insights
+    
+    The analysis over the marts runs afterwards in analyze_image_detections.
     """
     try:
         context.log.info("Starting YOLO enrichment...")
         
         # Check if images directory exists
-        images_path = Path(os.getenv('RAW_DATA_PATH', 'data/raw')) / 'images'
+        images_path = Path(scraped_data) / 'images'
         
         if not images_path.exists():
             context.log.warning(f"Images directory not found: {images_path}")
             context.log.info("Skipping YOLO enrichment - no images found")
             return {"status": "skipped", "reason": "no_images"}
         
-        # Count images
-        image_files = list(images_path.rglob('*.jpg')) + list(images_path.rglob('*.jpeg')) + list(images_path.rglob('*.png'))
-        
-        if not image_files:
+        # Only check that one image exists; the detector streams the rest from the walk
+        if next(iter_image_files(images_path), None) is None:
             context.log.warning("No image files found")
             return {"status": "skipped", "reason": "no_image_files"}
         
-        context.log.info(f"Found {len(image_files)} images to process")
+        context.log.info(f"Streaming images from {images_path} to the detector")
         
-        # Import and run YOLO detection
-        from yolo_detect import YOLODetector
-        
-        detector = YOLODetector()
+        # Reuse the preloaded detector
+        detector = context.resources.yolo
         
         # Run detection pipeline
-        pipeline_results = detector.run_detection_pipeline()
+        pipeline_results = detector.run_detection_pipeline(iter_image_files(images_path))
         
         if not pipeline_results:
             context.log.warning("YOLO pipeline returned no results")
             return {"status": "failed", "reason": "no_results"}
         
         # Load results to database
-        from load_yolo_results import YOLOResultsLoader
-        
         loader = YOLOResultsLoader()
-        loading_results = loader.run_loading_pipeline()
-        
-        # Analyze patterns
-        from analyze_image_patterns import ImagePatternAnalyzer
-        
-        analyzer = ImagePatternAnalyzer()
-        analysis_results = analyzer.generate_comprehensive_analysis()
+        loading_results = loader.run_loading_pipeline(results=pipeline_results['results'])
         
         # Compile results
         enrichment_results = {
             "status": "success",
-            "images_processed": pipeline_results['statistics'].get('total_images_processed', 0),
+            "images_processed": pipeline_results['images_processed'],
             "detection_results": pipeline_results['statistics'],
-            "loading_results": loading_results.get('statistics', {}),
-            "analysis_results": analysis_results.get('summary', {}),
+            "loading_results": (loading_results or {}).get('statistics', {}),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -326,10 +395,67 @@ def run_yolo_enrichment(context: OpExecutionContext, dbt_results: Dict[str, Any]
         context.log.error(f"YOLO enrichment failed: {e}")
         raise
 
+# Op 5: Rebuild the detections fact and analyze it once both branches have finished
+@op(
+    description="Rebuild fct_image_detections from this run's detections and analyze image patterns",
+    ins={
+        "enrichment_results": In(description="YOLO enrichment results"),
+        "dbt_results": In(Nothing, description="Waits for the main dbt run so the marts are not mid-rebuild"),
+    },
+    out=Out(description="Image pattern analysis summary"),
+)
+def analyze_image_detections(context: OpExecutionContext, enrichment_results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Analyze image content patterns over the finished marts.
+    
+    The main dbt run builds fct_image_detections in parallel with YOLO, before
+    this run's detections are loaded, so the model is rebuilt here first.
+    """
+    try:
+        if enrichment_results.get('status') == 'success' and enrichment_results.get('images_processed'):
+            context.log.info("Rebuilding fct_image_detections with this run's detections...")
+            result = dbtRunner().invoke(['run', '--select', 'fct_image_detections', *dbt_project_args()])
+            if not result.success:
+                raise Exception(f"dbt run of fct_image_detections failed: {result.exception or 'see dbt logs'}")
+        
+        analyzer = ImagePatternAnalyzer()
+        analysis_results = analyzer.generate_comprehensive_analysis()
+        
+        context.log.info("Image pattern analysis completed")
+        return analysis_results.get('summary', {})
+        
+    except Exception as e:
+        context.log.error(f"Image pattern analysis failed: {e}")
+        raise
+
+# Op 6: Join the warehouse and enrichment branches
+@op(
+    description="Combine dbt, YOLO and analysis results once all branches have finished",
+    ins={
+        "dbt_results": In(description="dbt transformation results"),
+        "enrichment_results": In(description="YOLO enrichment results"),
+        "analysis_results": In(description="Image pattern analysis summary"),
+    },
+    out=Out(description="Combined pipeline results"),
+)
+def summarize_pipeline_run(context: OpExecutionContext, dbt_results: Dict[str, Any],
+                           enrichment_results: Dict[str, Any], analysis_results: Dict[str, Any]) -> Dict[str, Any]:
+    """Collect the results of both pipeline branches and the analysis into one summary."""
+    summary = {
+        "dbt_success": dbt_results.get('run_success', False) and dbt_results.get('test_success', False),
+        "enrichment_status": enrichment_results.get('status'),
+        "analysis_results": analysis_results,
+        "timestamp": datetime.now().isoformat()
+    }
+    context.log.info(f"Pipeline run summary: {summary}")
+    return summary
+
 # Define the complete pipeline job
 @job(
     description="Complete Ethiopian Medical Business Data Pipeline",
     tags=["etl", "telegram", "medical", "dagster"],
+    executor_def=multiprocess_executor.configured({"max_concurrent": 4}),
+    resource_defs={"yolo": yolo_detector_resource},
 )
 def ethiopian_medical_pipeline():
     """
@@ -337,37 +463,47 @@ def ethiopian_medical_pipeline():
     
     Pipeline flow:
     1. Scrape Telegram data from medical channels
-    2. Load raw data to PostgreSQL database
-    3. Run dbt transformations to build data warehouse
-    4. Enrich with YOLO object detection on images
+    2. Load raw data to PostgreSQL database, then run dbt transformations
+    3. In parallel with 2, enrich the scraped images with YOLO object detection
+    4. Once both have finished, rebuild fct_image_detections and analyze image patterns
+    5. Summarize the run
     """
     
-    # Define the pipeline graph
-    scraped_data = scrape_telegram_data()
-    loaded_records = load_raw_to_postgres(scraped_data)
+    # Define the pipeline graph: YOLO only needs the images on disk, so it runs alongside load + dbt
+    if STREAM_TO_POSTGRES:
+        scraped_data, loaded_records = scrape_and_stream_to_postgres()
+    else:
+        scraped_data = scrape_telegram_data()
+        loaded_records = load_raw_to_postgres(scraped_data)
     dbt_results = run_dbt_transformations(loaded_records)
-    enrichment_results = run_yolo_enrichment(dbt_results)
+    enrichment_results = run_yolo_enrichment(scraped_data)
+    analysis_results = analyze_image_detections(enrichment_results, dbt_results=dbt_results)
     
-    return enrichment_results
+    return summarize_pipeline_run(dbt_results, enrichment_results, analysis_results)
 
 # Alternative job for just scraping and loading (useful for testing)
 @job(
     description="Scrape and load pipeline (without transformations)",
     tags=["etl", "telegram", "scraping"],
+    executor_def=in_process_executor,
 )
 def scrape_and_load_pipeline():
     """
     Lightweight pipeline for scraping and loading only.
     Useful for testing or when transformations are handled separately.
     """
-    scraped_data = scrape_telegram_data()
-    loaded_records = load_raw_to_postgres(scraped_data)
+    if STREAM_TO_POSTGRES:
+        _, loaded_records = scrape_and_stream_to_postgres()
+    else:
+        scraped_data = scrape_telegram_data()
+        loaded_records = load_raw_to_postgres(scraped_data)
     return loaded_records
 
 # Alternative job for transformations only
 @job(
     description="dbt transformations pipeline",
     tags=["dbt", "transformations", "warehouse"],
+    executor_def=in_process_executor,
 )
 def transformation_pipeline():
     """
@@ -381,15 +517,16 @@ def transformation_pipeline():
 @job(
     description="YOLO enrichment pipeline",
     tags=["yolo", "images", "enrichment"],
+    executor_def=in_process_executor,
+    resource_defs={"yolo": yolo_detector_resource},
 )
 def enrichment_pipeline():
     """
     Pipeline for YOLO object detection only.
     Assumes data warehouse is built.
     """
-    dummy_results = {"run_success": True, "test_success": True}
-    enrichment_results = run_yolo_enrichment(dummy_results)
-    return enrichment_results
+    enrichment_results = run_yolo_enrichment(os.getenv('RAW_DATA_PATH', 'data/raw'))
+    return analyze_image_detections(enrichment_results)
 
 # Asset definitions for tracking
 @asset(key="telegram_data", description="Scraped Telegram messages and images")
@@ -432,8 +569,6 @@ weekly_schedule = ScheduleDefinition(
 
 if __name__ == "__main__":
     # For local testing
-    import asyncio
-    
     print("Testing pipeline locally...")
     
     # Test individual ops
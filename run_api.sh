@@ -33,4 +33,4 @@ echo "Press Ctrl+C to stop the server"
 echo ""
 
 cd api
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+uvicorn main:app --host 0.0.0.0 --port 8000 --workers "${API_WORKERS:-$(nproc)}" --loop uvloop --http httptools
@@ -24,8 +24,9 @@ cd ..
 python src/load_to_postgres.py
 cd medical_warehouse
 
-# Step 2: Run dbt models
+# Step 2: Load lookup seeds and run dbt models
 echo "Step 2: Running dbt transformations..."
+dbt seed
 dbt run
 
 # Step 3: Run data quality tests
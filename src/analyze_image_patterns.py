@@ -4,56 +4,138 @@ Analyze image content patterns and generate insights
 """
 
 import os
-import json
-import logging
+import re
+import pickle
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import orjson
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+from config import Config
+from utils import configure_module_logger
+from db import get_engine
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/image_analysis.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Configure logging: records are formatted on the calling thread and written by a listener thread
+logger = configure_module_logger(__name__, 'logs/image_analysis.log', queued=True)
+
+# Query results are cached per version of the marts they read and reused until dbt changes them
+ANALYTICS_CACHE_PATH = Path(os.getenv('ANALYTICS_CACHE_PATH', '.cache/analytics'))
+
+# dbt rebuilds a table model by swapping in a new table, so its oid changes with every build
+# (and every full refresh); the incremental fct_messages also changes its scrape watermark
+DATA_VERSION_SQL = """
+select concat_ws('|',
+    to_regclass('analytics.dim_channels')::oid,
+    to_regclass('analytics.fct_image_detections')::oid,
+    to_regclass('analytics.fct_messages')::oid,
+    (select max(scraped_at) from analytics.fct_messages)
+);
+"""
 
 class ImagePatternAnalyzer:
     def __init__(self):
         """Initialize image pattern analyzer"""
-        self.db_host = os.getenv('DB_HOST', 'localhost')
-        self.db_port = os.getenv('DB_PORT', '5432')
-        self.db_name = os.getenv('DB_NAME', 'medical_warehouse')
-        self.db_user = os.getenv('DB_USER', 'postgres')
-        self.db_password = os.getenv('DB_PASSWORD', 'password')
-        
         self.results_path = Path('results')
         self.results_path.mkdir(exist_ok=True)
         
-        # Create database connection
-        self.connection_string = f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
-        self.engine = create_engine(self.connection_string)
+        # Shared pooled engine
+        self.engine = get_engine()
+        
+        # Channels the analyses are restricted to, bound into the queries as one text[] parameter
+        self.channels = Config.CHANNELS + Config.ADDITIONAL_CHANNELS
     
-    def execute_query(self, query: str) -> pd.DataFrame:
-        """Execute SQL query and return results"""
+    def get_data_version_dir(self) -> Path:
+        """
+        Get the cache directory for the current warehouse data version
+        
+        The version identifies the current build of the marts the analyses
+        read, so results cached while dbt is still rebuilding them expire once
+        the new tables are in place; directories for older versions are removed.
+        """
+        with self.engine.connect() as conn:
+            version = conn.execute(text(DATA_VERSION_SQL)).scalar() or ''
+        
+        version_dir = ANALYTICS_CACHE_PATH / hashlib.sha1(version.encode()).hexdigest()
+        if not version_dir.exists():
+            if ANALYTICS_CACHE_PATH.exists():
+                for stale_dir in ANALYTICS_CACHE_PATH.iterdir():
+                    if stale_dir != version_dir:
+                        shutil.rmtree(stale_dir, ignore_errors=True)
+            version_dir.mkdir(parents=True, exist_ok=True)
+        return version_dir
+    
+    def fetch_rows(self, query: str, statement_name: Optional[str] = None,
+                   params: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[tuple]]:
+        """
+        Execute SQL query and return its column names and row tuples, reusing cached results for unchanged data
+        
+        With a statement_name the query is PREPAREd once per pooled connection
+        and run with EXECUTE afterwards, so Postgres skips parsing and planning.
+        Numeric values come back as floats so the rows serialize to JSON.
+        """
+        params = params or {}
         try:
+            cache_key = query + repr(sorted(params.items()))
+            cache_file = self.get_data_version_dir() / f"{hashlib.sha1(cache_key.encode()).hexdigest()}.pkl"
+            if cache_file.exists():
+                return pickle.loads(cache_file.read_bytes())
+            
             with self.engine.connect() as conn:
-                result = conn.execute(text(query)).fetchall()
-                columns = result[0]._fields if result else []
-                df = pd.DataFrame([dict(row._mapping) for row in result], columns=columns)
-            return df
+                if statement_name:
+                    statement = self.prepare_statement(conn, statement_name, query, list(params))
+                else:
+                    statement = text(query)
+                
+                result = conn.execute(statement, params)
+                columns = list(result.keys())
+                rows = [
+                    tuple(float(value) if isinstance(value, Decimal) else value for value in row)
+                    for row in result
+                ]
+            
+            cache_file.write_bytes(pickle.dumps((columns, rows)))
+            return columns, rows
         except Exception as e:
             logger.error(f"Error executing query: {e}")
-            return pd.DataFrame()
+            return [], []
+    
+    def execute_query_records(self, query: str, statement_name: Optional[str] = None,
+                              params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Execute SQL query and return its rows as dicts"""
+        columns, rows = self.fetch_rows(query, statement_name, params)
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def execute_query(self, query: str, statement_name: Optional[str] = None,
+                      params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Execute SQL query and return results as a DataFrame built column-wise from the row tuples"""
+        columns, rows = self.fetch_rows(query, statement_name, params)
+        return pd.DataFrame.from_records(rows, columns=columns)
+    
+    def prepare_statement(self, conn, statement_name: str, query: str, param_names: Optional[List[str]] = None):
+        """PREPARE a query on this pooled connection if needed and return its EXECUTE statement"""
+        param_names = param_names or []
+        # Prepared statements live as long as the DBAPI connection, so track them on it
+        prepared = conn.connection.info.setdefault('prepared_statements', set())
+        if statement_name not in prepared:
+            # Named binds become positional $n parameters; their types come from the casts in the query
+            body = query.strip().rstrip(';')
+            for position, name in enumerate(param_names, start=1):
+                body = re.sub(rf"(?<!:):{name}\b", f"${position}", body)
+            conn.execute(text(f"PREPARE {statement_name} AS {body}"))
+            prepared.add(statement_name)
+        if param_names:
+            return text(f"EXECUTE {statement_name}({', '.join(':' + name for name in param_names)})")
+        return text(f"EXECUTE {statement_name}")
     
     def analyze_promotional_vs_product_performance(self) -> Dict[str, Any]:
         """Analyze if promotional posts get more views than product_display posts"""
@@ -69,6 +151,7 @@ class ImagePatternAnalyzer:
             from analytics.fct_image_detections img
             join analytics.fct_messages fm on img.message_id = fm.message_id
             join analytics.dim_channels dc on img.channel_key = dc.channel_key
+            join unnest(cast(:channels as text[])) as wanted(channel_name) on dc.channel_name = wanted.channel_name
             where img.calculated_category in ('promotional', 'product_display', 'lifestyle', 'other')
         ),
         category_stats as (
@@ -76,38 +159,45 @@ class ImagePatternAnalyzer:
                 calculated_category,
                 count(*) as post_count,
                 avg(view_count) as avg_views,
-                median(view_count) as median_views,
+                percentile_cont(0.5) within group (order by view_count) as median_views,
                 avg(forward_count) as avg_forwards,
-                median(forward_count) as median_forwards,
+                percentile_cont(0.5) within group (order by forward_count) as median_forwards,
                 stddev(view_count) as views_stddev
             from image_engagement
             group by calculated_category
         )
-        select * from category_stats order by avg_views desc;
+        select
+            *,
+            max(avg_views) filter (where calculated_category = 'promotional') over ()
+                / nullif(max(avg_views) filter (where calculated_category = 'product_display') over (), 0) as promo_ratio
+        from category_stats
+        order by avg_views desc;
         """
         
-        df = self.execute_query(query)
+        rows = self.execute_query_records(query, statement_name='analysis_promotional_performance',
+                                          params={'channels': self.channels})
         
-        if df.empty:
+        if not rows:
             return {}
         
-        # Convert to dictionary for JSON serialization
+        # Same value on every row; computed in SQL
+        promo_ratio = rows[0]['promo_ratio']
+        for row in rows:
+            del row['promo_ratio']
+        
         result = {
             'analysis_type': 'promotional_vs_product_performance',
             'timestamp': datetime.now().isoformat(),
-            'data': df.to_dict('records'),
+            'data': rows,
             'key_insights': []
         }
         
-        # Generate insights
-        if len(df) > 1:
-            promotional_views = df[df['calculated_category'] == 'promotional']['avg_views'].iloc[0] if 'promotional' in df['calculated_category'].values else 0
-            product_views = df[df['calculated_category'] == 'product_display']['avg_views'].iloc[0] if 'product_display' in df['calculated_category'].values else 0
-            
-            if promotional_views > product_views:
-                result['key_insights'].append(f"Promotional posts get {promotional_views/product_views:.1f}x more views than product-only posts")
+        # Generate insights (no ratio when either category is missing or has no views)
+        if len(rows) > 1 and promo_ratio:
+            if promo_ratio > 1:
+                result['key_insights'].append(f"Promotional posts get {promo_ratio:.1f}x more views than product-only posts")
             else:
-                result['key_insights'].append(f"Product-only posts get {product_views/promotional_views:.1f}x more views than promotional posts")
+                result['key_insights'].append(f"Product-only posts get {1 / promo_ratio:.1f}x more views than promotional posts")
         
         return result
     
@@ -121,36 +211,48 @@ class ImagePatternAnalyzer:
                 dc.channel_type,
                 count(*) as total_messages,
                 count(img.message_id) as messages_with_images,
-                count(case when img.calculated_category is not null then 1 end) as images_analyzed,
+                count(*) filter (where img.calculated_category is not null) as images_analyzed,
                 round(count(img.message_id) * 100.0 / count(*), 2) as image_percentage
             from analytics.dim_channels dc
+            join unnest(cast(:channels as text[])) as wanted(channel_name) on dc.channel_name = wanted.channel_name
             left join analytics.fct_messages fm on dc.channel_key = fm.channel_key
             left join analytics.fct_image_detections img on fm.message_id = img.message_id
             group by dc.channel_name, dc.channel_type
+        ),
+        channel_averages as (
+            select *, avg(image_percentage) over () as avg_visual_rate
+            from channel_visual_content
         )
-        select * from channel_visual_content order by image_percentage desc;
+        select
+            *,
+            count(*) filter (where image_percentage > avg_visual_rate) over () as high_visual_channels
+        from channel_averages
+        order by image_percentage desc;
         """
         
-        df = self.execute_query(query)
+        rows = self.execute_query_records(query, statement_name='analysis_channel_visual_content',
+                                          params={'channels': self.channels})
         
-        if df.empty:
+        if not rows:
             return {}
         
+        # Same values on every row; computed in SQL
+        high_visual_channels = rows[0]['high_visual_channels']
+        for row in rows:
+            del row['avg_visual_rate'], row['high_visual_channels']
+        
         result = {
             'analysis_type': 'channel_visual_content',
             'timestamp': datetime.now().isoformat(),
-            'data': df.to_dict('records'),
+            'data': rows,
             'key_insights': []
         }
         
         # Generate insights
-        if len(df) > 0:
-            top_channel = df.iloc[0]
+        if rows:
+            top_channel = rows[0]
             result['key_insights'].append(f"{top_channel['channel_name']} has the highest visual content rate at {top_channel['image_percentage']}%")
-            
-            avg_visual_rate = df['image_percentage'].mean()
-            high_visual_channels = df[df['image_percentage'] > avg_visual_rate]
-            result['key_insights'].append(f"{len(high_visual_channels)} channels have above-average visual content usage")
+            result['key_insights'].append(f"{high_visual_channels} channels have above-average visual content usage")
         
         return result
     
@@ -170,6 +272,7 @@ class ImagePatternAnalyzer:
             from analytics.fct_image_detections img
             join analytics.fct_messages fm on img.message_id = fm.message_id
             join analytics.dim_channels dc on img.channel_key = dc.channel_key
+            join unnest(cast(:channels as text[])) as wanted(channel_name) on dc.channel_name = wanted.channel_name
         ),
         quality_stats as (
             select 
@@ -185,23 +288,24 @@ class ImagePatternAnalyzer:
         select * from quality_stats order by confidence_level, detection_density;
         """
         
-        df = self.execute_query(query)
+        rows = self.execute_query_records(query, statement_name='analysis_detection_quality',
+                                          params={'channels': self.channels})
         
-        if df.empty:
+        if not rows:
             return {}
         
         result = {
             'analysis_type': 'detection_limitations',
             'timestamp': datetime.now().isoformat(),
-            'data': df.to_dict('records'),
+            'data': rows,
             'key_insights': [],
             'limitations': []
         }
         
         # Generate insights about limitations
-        low_confidence_images = df[df['confidence_level'] == 'low_confidence']['image_count'].sum() if 'low_confidence' in df['confidence_level'].values else 0
-        no_detection_images = df[df['detection_density'] == 'no_objects']['image_count'].sum() if 'no_objects' in df['detection_density'].values else 0
-        total_images = df['image_count'].sum()
+        low_confidence_images = sum(row['image_count'] for row in rows if row['confidence_level'] == 'low_confidence')
+        no_detection_images = sum(row['image_count'] for row in rows if row['detection_density'] == 'no_objects')
+        total_images = sum(row['image_count'] for row in rows)
         
         if total_images > 0:
             low_conf_rate = (low_confidence_images / total_images) * 100
@@ -225,11 +329,15 @@ class ImagePatternAnalyzer:
         """Generate comprehensive image content analysis"""
         logger.info("Starting comprehensive image content analysis")
         
-        analyses = {
-            'promotional_performance': self.analyze_promotional_vs_product_performance(),
-            'channel_visual_content': self.analyze_channel_visual_content(),
-            'detection_limitations': self.analyze_detection_limitations()
+        # The analyses are independent, so run their queries concurrently on separate pooled connections
+        analysis_steps = {
+            'promotional_performance': self.analyze_promotional_vs_product_performance,
+            'channel_visual_content': self.analyze_channel_visual_content,
+            'detection_limitations': self.analyze_detection_limitations
         }
+        with ThreadPoolExecutor(max_workers=len(analysis_steps)) as pool:
+            futures = {name: pool.submit(step) for name, step in analysis_steps.items()}
+            analyses = {name: future.result() for name, future in futures.items()}
         
         # Generate summary
         summary = {
@@ -252,18 +360,18 @@ class ImagePatternAnalyzer:
             'analyses': analyses
         }
         
-        # Save results
+        # Save results as compact UTF-8 JSON; the data arrays are small aggregates, so one file is enough
         results_file = self.results_path / 'image_pattern_analysis.json'
-        with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        results_file.write_bytes(orjson.dumps(result))
         
         logger.info(f"Analysis results saved to {results_file}")
         
         return result
     
-    def create_summary_report(self) -> str:
-        """Create a text summary report"""
-        analysis = self.generate_comprehensive_analysis()
+    def create_summary_report(self, analysis: Optional[Dict[str, Any]] = None) -> str:
+        """Create a text summary report, reusing an already generated analysis when given"""
+        if analysis is None:
+            analysis = self.generate_comprehensive_analysis()
         
         report = []
         report.append("=" * 80)
@@ -345,7 +453,7 @@ def main():
         analysis = analyzer.generate_comprehensive_analysis()
         
         # Create summary report
-        report = analyzer.create_summary_report()
+        report = analyzer.create_summary_report(analysis)
         
         print("\n=== Image Content Analysis Complete ===")
         print(f"Key findings: {len(analysis['summary']['key_findings'])}")
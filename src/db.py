@@ -0,0 +1,30 @@
+"""
+Shared database engine for the pipeline modules
+"""
+
+import os
+import functools
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration
+DATABASE_URL = f"postgresql+psycopg2://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'medical_warehouse')}"
+
+# Server-side cap on any single statement, so a runaway analytic query can't hang a run
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '60000'))
+
+@functools.lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """Get the process-wide engine, creating its connection pool on first use"""
+    return create_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '15')),
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={'options': f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+    )
@@ -4,47 +4,59 @@ Load raw Telegram data from JSON files to PostgreSQL database
 """
 
 import os
-import json
-import logging
-from datetime import datetime
+import asyncio
+import functools
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
+import orjson
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 
+from db import get_engine
+from utils import configure_module_logger
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/data_loading.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Configure logging: records are formatted on the calling thread and written by a listener thread
+logger = configure_module_logger(__name__, 'logs/data_loading.log', queued=True)
+
+# Columns written to raw.telegram_messages, in COPY order
+RAW_MESSAGE_COLUMNS = [
+    'message_id', 'channel_name', 'message_date', 'message_text',
+    'has_media', 'image_path', 'views', 'forwards', 'scraped_at', 'file_path'
+]
+
+# Messages buffered across JSON files before each COPY
+COPY_BATCH_SIZE = int(os.getenv('COPY_BATCH_SIZE', '20000'))
+
+# Messages buffered from a live scrape before each COPY
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+
+# Monthly partitions loaded concurrently, one connection each
+LOAD_PARALLELISM = int(os.getenv('LOAD_PARALLELISM', '4'))
+
+# Processes parsing and cleaning JSON files in parallel
+LOAD_WORKERS = int(os.getenv('LOAD_WORKERS', str(os.cpu_count() or 1)))
 
 class PostgresDataLoader:
     def __init__(self):
         """Initialize PostgreSQL data loader"""
-        self.db_host = os.getenv('DB_HOST', 'localhost')
-        self.db_port = os.getenv('DB_PORT', '5432')
-        self.db_name = os.getenv('DB_NAME', 'medical_warehouse')
-        self.db_user = os.getenv('DB_USER', 'postgres')
-        self.db_password = os.getenv('DB_PASSWORD', 'password')
-        
         self.raw_data_path = Path(os.getenv('RAW_DATA_PATH', 'data/raw'))
         
-        # Create database connection
-        self.connection_string = f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
-        self.engine = create_engine(self.connection_string)
+        # Shared pooled engine
+        self.engine = get_engine()
+        
+        # Set by create_raw_schema; tables created before partitioning keep loading unpartitioned
+        self.partitioned = False
         
     def create_raw_schema(self):
-        """Create raw schema and telegram_messages table"""
+        """Create raw schema and telegram_messages table, partitioned by month of message_date"""
         logger.info("Creating raw schema and tables...")
         
         create_schema_sql = """
@@ -64,41 +76,60 @@ class PostgresDataLoader:
             scraped_at TIMESTAMP,
             file_path VARCHAR(500),
             loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (message_id, channel_name)
-        );
+            PRIMARY KEY (message_id, channel_name, message_date)
+        ) PARTITION BY RANGE (message_date);
+        """
+        
+        table_kind_sql = """
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'raw' AND c.relname = 'telegram_messages';
         """
         
         try:
             with self.engine.connect() as conn:
                 conn.execute(text(create_schema_sql))
                 conn.execute(text(create_table_sql))
+                self.partitioned = conn.execute(text(table_kind_sql)).scalar() == 'p'
                 conn.commit()
-            logger.info("Raw schema and tables created successfully")
+            logger.info(f"Raw schema and tables created successfully (partitioned: {self.partitioned})")
         except SQLAlchemyError as e:
             logger.error(f"Error creating schema: {e}")
             raise
     
-    def find_json_files(self) -> List[Path]:
-        """Find all JSON files in the telegram_messages directory"""
-        json_files = []
+    def iter_json_files(self) -> Iterator[Path]:
+        """Yield JSON and JSON Lines files in the telegram_messages directory as they are discovered"""
         messages_dir = self.raw_data_path / 'telegram_messages'
         
         if not messages_dir.exists():
             logger.error(f"Messages directory not found: {messages_dir}")
-            return json_files
-        
-        # Recursively find all JSON files
-        for json_file in messages_dir.rglob('*.json'):
-            json_files.append(json_file)
+            return
         
+        # Walk the tree with scandir, which reuses the directory entry type instead of a stat per path
+        pending_dirs = [messages_dir]
+        while pending_dirs:
+            with os.scandir(pending_dirs.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.name.endswith(('.json', '.jsonl')):
+                        yield Path(entry.path)
+    
+    def find_json_files(self) -> List[Path]:
+        """Find all JSON files in the telegram_messages directory"""
+        json_files = list(self.iter_json_files())
         logger.info(f"Found {len(json_files)} JSON files to process")
         return json_files
     
     def load_json_file(self, file_path: Path) -> List[Dict[str, Any]]:
-        """Load and parse JSON file"""
+        """Load and parse a JSON array file or a JSON Lines file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if file_path.suffix == '.jsonl':
+                # One message per line, as appended by the scraper
+                data = [orjson.loads(line) for line in file_path.read_bytes().splitlines() if line.strip()]
+            else:
+                data = orjson.loads(file_path.read_bytes())
             
             # Add file path to each record for tracking
             for record in data:
@@ -109,105 +140,120 @@ class PostgresDataLoader:
             logger.error(f"Error loading JSON file {file_path}: {e}")
             return []
     
-    def validate_message(self, message: Dict[str, Any]) -> bool:
-        """Validate message record"""
-        required_fields = ['message_id', 'channel_name', 'message_date']
-        
-        for field in required_fields:
-            if field not in message or message[field] is None:
-                return False
-        
-        # Validate message_id is positive
-        try:
-            if int(message['message_id']) <= 0:
-                return False
-        except (ValueError, TypeError):
-            return False
-        
-        return True
-    
-    def clean_and_transform_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
-        """Clean and transform message data"""
-        cleaned = message.copy()
+    def clean_messages(self, messages: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Validate and clean a batch of messages column-wise
         
-        # Convert message_id to integer
-        try:
-            cleaned['message_id'] = int(cleaned['message_id'])
-        except (ValueError, TypeError):
-            cleaned['message_id'] = None
+        Rows without a positive message_id, a channel_name or a parseable
+        message_date are dropped (message_date is part of the key).
+        """
+        df = pd.DataFrame(messages).reindex(columns=RAW_MESSAGE_COLUMNS)
+        if df.empty:
+            return df
         
-        # Parse message_date
-        try:
-            if isinstance(cleaned['message_date'], str):
-                # Handle ISO format with potential Z suffix
-                date_str = cleaned['message_date'].replace('Z', '+00:00')
-                cleaned['message_date'] = datetime.fromisoformat(date_str)
-        except (ValueError, TypeError):
-            cleaned['message_date'] = None
+        df['message_id'] = pd.to_numeric(df['message_id'], errors='coerce').astype('Int64')
+        df['message_date'] = pd.to_datetime(df['message_date'], utc=True, errors='coerce', format='ISO8601')
         
-        # Clean numeric fields
+        # Clean numeric and boolean fields
         for field in ['views', 'forwards']:
-            try:
-                cleaned[field] = int(cleaned.get(field, 0)) if cleaned.get(field) else 0
-            except (ValueError, TypeError):
-                cleaned[field] = 0
-        
-        # Clean boolean fields
-        cleaned['has_media'] = bool(cleaned.get('has_media', False))
+            df[field] = pd.to_numeric(df[field], errors='coerce').fillna(0).astype('int64')
+        df['has_media'] = df['has_media'].fillna(False).astype(bool)
         
         # Clean text fields
         for field in ['channel_name', 'message_text', 'image_path', 'file_path']:
-            if field in cleaned and cleaned[field] is not None:
-                cleaned[field] = str(cleaned[field]).strip()
-            else:
-                cleaned[field] = None
+            df[field] = df[field].where(df[field].isna(), df[field].astype(str).str.strip())
         
-        return cleaned
+        valid = df['message_id'].gt(0).fillna(False) & df['channel_name'].notna() & df['message_date'].notna()
+        return df[valid]
+    
+    def partition_name(self, month: date) -> str:
+        """Get the monthly partition table for a month"""
+        return f"raw.telegram_messages_{month:%Y%m}"
+    
+    def ensure_month_partitions(self, months) -> None:
+        """Create any missing monthly partitions before rows are routed to them"""
+        with self.engine.connect() as conn:
+            for month in sorted(months):
+                next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {self.partition_name(month)} "
+                    f"PARTITION OF raw.telegram_messages "
+                    f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+                ))
+            conn.commit()
     
     def load_messages_to_db(self, messages: List[Dict[str, Any]]) -> int:
         """Load messages to PostgreSQL database"""
         if not messages:
             return 0
         
-        # Clean and transform messages
-        cleaned_messages = []
-        for message in messages:
-            if self.validate_message(message):
-                cleaned = self.clean_and_transform_message(message)
-                cleaned_messages.append(cleaned)
-        
-        if not cleaned_messages:
+        return self.load_clean_messages(self.clean_messages(messages))
+    
+    def load_clean_messages(self, cleaned: pd.DataFrame) -> int:
+        """Load cleaned messages, copying each month's partition on its own connection"""
+        if cleaned.empty:
             logger.warning("No valid messages to load")
             return 0
         
-        # Convert to DataFrame
-        df = pd.DataFrame(cleaned_messages)
+        if not self.partitioned:
+            rows_inserted = self.copy_messages(cleaned, 'raw.telegram_messages')
+            logger.info(f"Loaded {rows_inserted} messages to database")
+            return rows_inserted
         
-        # Select only required columns
-        required_columns = [
-            'message_id', 'channel_name', 'message_date', 'message_text',
-            'has_media', 'image_path', 'views', 'forwards', 'scraped_at', 'file_path'
+        message_dates = cleaned['message_date'].dt
+        months = [
+            (date(year, month, 1), month_df)
+            for (year, month), month_df in cleaned.groupby([message_dates.year, message_dates.month])
         ]
         
-        df = df[required_columns]
+        self.ensure_month_partitions(month for month, _ in months)
         
+        with ThreadPoolExecutor(max_workers=min(LOAD_PARALLELISM, len(months))) as pool:
+            rows_inserted = sum(pool.map(
+                lambda item: self.copy_messages(item[1], self.partition_name(item[0])),
+                months
+            ))
+        
+        logger.info(f"Loaded {rows_inserted} messages to database across {len(months)} partitions")
+        return rows_inserted
+    
+    def copy_messages(self, cleaned: pd.DataFrame, target_table: str) -> int:
+        """COPY cleaned messages into target_table, skipping ones already loaded"""
+        # Serialize the batch as CSV (None and empty strings both load as NULL)
+        buffer = io.StringIO()
+        cleaned.to_csv(buffer, columns=RAW_MESSAGE_COLUMNS, header=False, index=False)
+        buffer.seek(0)
+        
+        columns = ', '.join(RAW_MESSAGE_COLUMNS)
+        
+        # COPY into a temp table, then merge so re-scraped messages are skipped instead of failing the batch
+        raw_conn = self.engine.raw_connection()
         try:
-            # Use upsert to handle duplicates
-            rows_inserted = df.to_sql(
-                'telegram_messages',
-                self.engine,
-                schema='raw',
-                if_exists='append',
-                index=False,
-                method='multi'
-            )
+            with raw_conn.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TEMP TABLE tmp_telegram_messages "
+                    "(LIKE raw.telegram_messages INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cursor.copy_expert(
+                    f"COPY tmp_telegram_messages ({columns}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cursor.execute(
+                    f"INSERT INTO {target_table} ({columns}) "
+                    f"SELECT {columns} FROM tmp_telegram_messages "
+                    "ON CONFLICT DO NOTHING"
+                )
+                rows_inserted = cursor.rowcount
+            raw_conn.commit()
             
-            logger.info(f"Loaded {rows_inserted} messages to database")
             return rows_inserted
             
-        except SQLAlchemyError as e:
+        except Exception as e:
+            raw_conn.rollback()
             logger.error(f"Error loading messages to database: {e}")
             raise
+        finally:
+            raw_conn.close()
     
     def load_all_data(self):
         """Load all JSON files to PostgreSQL"""
@@ -217,31 +263,60 @@ class PostgresDataLoader:
             # Create schema and tables
             self.create_raw_schema()
             
-            # Find all JSON files
-            json_files = self.find_json_files()
-            
             total_messages_loaded = 0
+            files_processed = 0
+            batch = []
+            batch_rows = 0
             
-            for file_path in json_files:
-                logger.info(f"Processing file: {file_path}")
-                
-                # Load JSON data
-                messages = self.load_json_file(file_path)
-                
-                if messages:
-                    # Load to database
-                    messages_loaded = self.load_messages_to_db(messages)
-                    total_messages_loaded += messages_loaded
-                else:
-                    logger.warning(f"No messages found in {file_path}")
+            # Parse and clean files across processes as they are discovered; COPY stays in this process
+            with ProcessPoolExecutor(max_workers=LOAD_WORKERS, initializer=configure_worker_logging) as pool:
+                for file_path, messages in pool.map(clean_message_file, self.iter_json_files(), chunksize=4):
+                    files_processed += 1
+                    logger.info(f"Processed file: {file_path}")
+                    
+                    if not messages.empty:
+                        batch.append(messages)
+                        batch_rows += len(messages)
+                    else:
+                        logger.warning(f"No valid messages found in {file_path}")
+                    
+                    # Load to database once the batch is large enough
+                    if batch_rows >= COPY_BATCH_SIZE:
+                        total_messages_loaded += self.load_clean_messages(pd.concat(batch, ignore_index=True))
+                        batch = []
+                        batch_rows = 0
             
-            logger.info(f"Data loading completed. Total messages loaded: {total_messages_loaded}")
+            if batch:
+                total_messages_loaded += self.load_clean_messages(pd.concat(batch, ignore_index=True))
+            
+            logger.info(f"Data loading completed. Files processed: {files_processed}, total messages loaded: {total_messages_loaded}")
             return total_messages_loaded
             
         except Exception as e:
             logger.error(f"Error during data loading: {e}")
             raise
     
+    async def copy_from_queue(self, message_queue: asyncio.Queue, batch_size: int = STREAM_BATCH_SIZE) -> int:
+        """
+        Load messages from a queue while they are being scraped
+        
+        Consumes messages until a None sentinel arrives, copying them in
+        batches; the blocking COPY runs in a worker thread so scraping continues.
+        """
+        total_messages_loaded = 0
+        batch = []
+        
+        while (message := await message_queue.get()) is not None:
+            batch.append(message)
+            if len(batch) >= batch_size:
+                total_messages_loaded += await asyncio.to_thread(self.load_messages_to_db, batch)
+                batch = []
+        
+        total_messages_loaded += await asyncio.to_thread(self.load_messages_to_db, batch)
+        
+        logger.info(f"Streaming load completed. Total messages loaded: {total_messages_loaded}")
+        return total_messages_loaded
+    
     def get_loading_stats(self):
         """Get statistics about loaded data"""
         stats_sql = """
@@ -250,7 +325,7 @@ class PostgresDataLoader:
             COUNT(DISTINCT channel_name) as unique_channels,
             MIN(message_date) as earliest_message,
             MAX(message_date) as latest_message,
-            COUNT(CASE WHEN has_media = true THEN 1 END) as messages_with_media
+            COUNT(*) FILTER (WHERE has_media) as messages_with_media
         FROM raw.telegram_messages;
         """
         
@@ -262,6 +337,20 @@ class PostgresDataLoader:
             logger.error(f"Error getting loading stats: {e}")
             return {}
 
+def configure_worker_logging():
+    """Log directly from worker processes; a forked child has no thread draining the inherited queue"""
+    configure_module_logger(__name__, 'logs/data_loading.log')
+
+@functools.lru_cache(maxsize=1)
+def _worker_loader() -> PostgresDataLoader:
+    """Loader reused by every file a worker process handles"""
+    return PostgresDataLoader()
+
+def clean_message_file(file_path: Path) -> Tuple[Path, pd.DataFrame]:
+    """Parse, validate and clean one JSON file; runs in a worker process"""
+    loader = _worker_loader()
+    return file_path, loader.clean_messages(loader.load_json_file(file_path))
+
 def main():
     """Main function"""
     loader = PostgresDataLoader()
@@ -3,47 +3,71 @@
 Load YOLO detection results into PostgreSQL database
 """
 
-import os
+import io
 import json
-import logging
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 
+from db import get_engine
+from utils import configure_module_logger
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/yolo_loading.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = configure_module_logger(__name__, 'logs/yolo_loading.log')
+
+# Columns loaded into raw.yolo_detections
+YOLO_DB_COLUMNS = [
+    'message_id', 'channel_name', 'image_path', 'image_category',
+    'total_detections', 'person_count', 'product_count',
+    'max_confidence', 'avg_confidence', 'top_class', 'top_confidence',
+    'processing_timestamp'
+]
+
+# Columns a detection record must have to be loaded
+YOLO_REQUIRED_COLUMNS = frozenset({
+    'message_id', 'channel_name', 'image_category',
+    'total_detections', 'person_count', 'product_count',
+    'max_confidence', 'avg_confidence'
+})
+
+# Parse types for the CSV columns whose type is fixed (ids and counts are cast after validation)
+YOLO_CSV_DTYPES = {
+    'channel_name': 'string',
+    'image_path': 'string',
+    'image_category': 'string',
+    'top_class': 'string',
+    'max_confidence': 'float64',
+    'avg_confidence': 'float64',
+    'top_confidence': 'float64'
+}
 
 class YOLOResultsLoader:
     def __init__(self):
         """Initialize YOLO results loader"""
-        self.db_host = os.getenv('DB_HOST', 'localhost')
-        self.db_port = os.getenv('DB_PORT', '5432')
-        self.db_name = os.getenv('DB_NAME', 'medical_warehouse')
-        self.db_user = os.getenv('DB_USER', 'postgres')
-        self.db_password = os.getenv('DB_PASSWORD', 'password')
-        
         self.results_path = Path('results')
         
-        # Create database connection
-        self.connection_string = f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
-        self.engine = create_engine(self.connection_string)
+        # Shared pooled engine
+        self.engine = get_engine()
+    
+    @contextmanager
+    def transaction(self, conn: Optional[Connection] = None) -> Iterator[Connection]:
+        """Use the caller's connection (and its transaction), or run in a new transaction on a pooled one"""
+        if conn is not None:
+            yield conn
+        else:
+            with self.engine.begin() as conn:
+                yield conn
     
-    def create_yolo_results_table(self):
+    def create_yolo_results_table(self, conn: Optional[Connection] = None):
         """Create table for YOLO detection results"""
         logger.info("Creating YOLO results table...")
         
@@ -64,12 +88,13 @@ class YOLOResultsLoader:
             loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY (message_id, channel_name)
         );
+        
+        CREATE INDEX IF NOT EXISTS yolo_detections_category_idx ON raw.yolo_detections (image_category);
         """
         
         try:
-            with self.engine.connect() as conn:
+            with self.transaction(conn) as conn:
                 conn.execute(text(create_table_sql))
-                conn.commit()
             logger.info("YOLO results table created successfully")
         except SQLAlchemyError as e:
             logger.error(f"Error creating YOLO results table: {e}")
@@ -84,7 +109,12 @@ class YOLOResultsLoader:
             return pd.DataFrame()
         
         try:
-            df = pd.read_csv(csv_path)
+            # Only parse the columns that get loaded, with their types declared up front
+            df = pd.read_csv(
+                csv_path,
+                usecols=lambda col: col in YOLO_DB_COLUMNS,
+                dtype=YOLO_CSV_DTYPES
+            )
             logger.info(f"Loaded {len(df)} records from {csv_path}")
             return df
         except Exception as e:
@@ -96,81 +126,85 @@ class YOLOResultsLoader:
         if df.empty:
             return df
         
-        # Required columns
-        required_columns = [
-            'message_id', 'channel_name', 'image_category', 
-            'total_detections', 'person_count', 'product_count',
-            'max_confidence', 'avg_confidence'
-        ]
-        
         # Check for required columns
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = YOLO_REQUIRED_COLUMNS.difference(df.columns)
         if missing_columns:
-            logger.error(f"Missing required columns: {missing_columns}")
+            logger.error(f"Missing required columns: {sorted(missing_columns)}")
             return pd.DataFrame()
         
-        # Filter invalid records
-        valid_df = df[
-            (df['message_id'].notna()) & 
-            (df['channel_name'].notna()) & 
-            (df['image_category'].notna()) &
-            (df['total_detections'] >= 0) &
-            (df['person_count'] >= 0) &
-            (df['product_count'] >= 0)
-        ].copy()
-        
-        # Convert data types
-        valid_df['message_id'] = valid_df['message_id'].astype('int64')
-        valid_df['total_detections'] = valid_df['total_detections'].astype('int')
-        valid_df['person_count'] = valid_df['person_count'].astype('int')
-        valid_df['product_count'] = valid_df['product_count'].astype('int')
+        # Filter invalid records with one combined mask over the raw arrays
+        valid_mask = (
+            df['message_id'].notna().to_numpy()
+            & df['channel_name'].notna().to_numpy()
+            & df['image_category'].notna().to_numpy()
+            & (df['total_detections'].to_numpy() >= 0)
+            & (df['person_count'].to_numpy() >= 0)
+            & (df['product_count'].to_numpy() >= 0)
+        )
+        valid_df = df[valid_mask].astype({
+            'message_id': 'int64',
+            'total_detections': 'int32',
+            'person_count': 'int32',
+            'product_count': 'int32'
+        })
         
-        # Parse timestamp
+        # Parse timestamp (written by the detector with isoformat())
         if 'processing_timestamp' in valid_df.columns:
-            valid_df['processing_timestamp'] = pd.to_datetime(valid_df['processing_timestamp'])
+            valid_df['processing_timestamp'] = pd.to_datetime(valid_df['processing_timestamp'], format='ISO8601')
         
         logger.info(f"Validated {len(valid_df)} records out of {len(df)} total")
         return valid_df
     
-    def load_to_database(self, df: pd.DataFrame) -> int:
+    def load_to_database(self, df: pd.DataFrame, conn: Optional[Connection] = None) -> int:
         """Load YOLO results to PostgreSQL database"""
         if df.empty:
             logger.warning("No data to load")
             return 0
         
         try:
-            # Select columns for database
-            db_columns = [
-                'message_id', 'channel_name', 'image_path', 'image_category',
-                'total_detections', 'person_count', 'product_count',
-                'max_confidence', 'avg_confidence', 'top_class', 'top_confidence',
-                'processing_timestamp'
-            ]
-            
             # Filter to available columns
-            available_columns = [col for col in db_columns if col in df.columns]
-            db_df = df[available_columns].copy()
+            available_columns = [col for col in YOLO_DB_COLUMNS if col in df.columns]
+            db_df = df[available_columns]
+            
+            # Serialize the batch as CSV (NaN loads as NULL)
+            buffer = io.StringIO()
+            db_df.to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
             
-            # Use upsert to handle duplicates
-            rows_inserted = db_df.to_sql(
-                'yolo_detections',
-                self.engine,
-                schema='raw',
-                if_exists='append',
-                index=False,
-                method='multi'
+            columns = ', '.join(available_columns)
+            updates = ', '.join(
+                [f"{col} = EXCLUDED.{col}" for col in available_columns if col not in ('message_id', 'channel_name')]
+                + ['loaded_at = CURRENT_TIMESTAMP']
             )
             
+            # COPY into a temp table, then upsert in one statement; DISTINCT ON keeps a
+            # key repeated within the batch from hitting the same row twice
+            with self.transaction(conn) as conn, conn.connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TEMP TABLE tmp_yolo_detections "
+                    "(LIKE raw.yolo_detections INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cursor.copy_expert(
+                    f"COPY tmp_yolo_detections ({columns}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cursor.execute(
+                    f"INSERT INTO raw.yolo_detections ({columns}) "
+                    f"SELECT DISTINCT ON (message_id, channel_name) {columns} FROM tmp_yolo_detections "
+                    f"ON CONFLICT (message_id, channel_name) DO UPDATE SET {updates}"
+                )
+                rows_inserted = cursor.rowcount
+            
             logger.info(f"Loaded {rows_inserted} YOLO detection records to database")
             return rows_inserted
             
-        except SQLAlchemyError as e:
+        except Exception as e:
             logger.error(f"Error loading YOLO results to database: {e}")
             raise
     
-    def get_loading_statistics(self) -> Dict[str, Any]:
+    def get_loading_statistics(self, conn: Optional[Connection] = None) -> Dict[str, Any]:
         """Get statistics about loaded YOLO data"""
-        stats_sql = """
+        summary_sql = """
         SELECT 
             COUNT(*) as total_detections,
             COUNT(DISTINCT channel_name) as unique_channels,
@@ -178,75 +212,86 @@ class YOLOResultsLoader:
             AVG(total_detections) as avg_detections_per_image,
             AVG(person_count) as avg_persons_per_image,
             AVG(product_count) as avg_products_per_image,
-            COUNT(CASE WHEN person_count > 0 THEN 1 END) as images_with_persons,
-            COUNT(CASE WHEN product_count > 0 THEN 1 END) as images_with_products,
-            image_category,
-            COUNT(*) as category_count
+            COUNT(*) FILTER (WHERE person_count > 0) as images_with_persons,
+            COUNT(*) FILTER (WHERE product_count > 0) as images_with_products
+        FROM raw.yolo_detections;
+        """
+        
+        # Served from the image_category index
+        category_sql = """
+        SELECT image_category, COUNT(*) as category_count
         FROM raw.yolo_detections
-        GROUP BY ROLLUP(image_category);
+        GROUP BY image_category
+        ORDER BY image_category;
         """
         
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(stats_sql)).fetchall()
-                
-                # Convert to dictionary
-                stats = {
-                    'total_records': [],
-                    'category_breakdown': []
-                }
-                
-                for row in result:
-                    if row.image_category is None:
-                        stats['total_records'] = {
-                            'total_detections': row.total_detections,
-                            'unique_channels': row.unique_channels,
-                            'unique_categories': row.unique_categories,
-                            'avg_detections_per_image': float(row.avg_detections_per_image) if row.avg_detections_per_image else 0,
-                            'avg_persons_per_image': float(row.avg_persons_per_image) if row.avg_persons_per_image else 0,
-                            'avg_products_per_image': float(row.avg_products_per_image) if row.avg_products_per_image else 0,
-                            'images_with_persons': row.images_with_persons,
-                            'images_with_products': row.images_with_products
-                        }
-                    else:
-                        stats['category_breakdown'].append({
-                            'category': row.image_category,
-                            'count': row.category_count
-                        })
-                
-                return stats
-                
+            with self.transaction(conn) as conn:
+                summary = conn.execute(text(summary_sql)).one()
+                categories = conn.execute(text(category_sql)).fetchall()
+            
+            # Convert to dictionary
+            return {
+                'total_records': {
+                    'total_detections': summary.total_detections,
+                    'unique_channels': summary.unique_channels,
+                    'unique_categories': summary.unique_categories,
+                    'avg_detections_per_image': float(summary.avg_detections_per_image) if summary.avg_detections_per_image else 0,
+                    'avg_persons_per_image': float(summary.avg_persons_per_image) if summary.avg_persons_per_image else 0,
+                    'avg_products_per_image': float(summary.avg_products_per_image) if summary.avg_products_per_image else 0,
+                    'images_with_persons': summary.images_with_persons,
+                    'images_with_products': summary.images_with_products
+                },
+                'category_breakdown': [
+                    {'category': row.image_category, 'count': row.category_count}
+                    for row in categories
+                ]
+            }
+            
         except SQLAlchemyError as e:
             logger.error(f"Error getting loading statistics: {e}")
             return {}
     
-    def run_loading_pipeline(self, csv_file: str = 'yolo_detections.csv'):
-        """Run the complete YOLO results loading pipeline"""
+    def run_loading_pipeline(self, csv_file: str = 'yolo_detections.csv',
+                             results: Optional[List[Dict[str, Any]]] = None):
+        """
+        Run the complete YOLO results loading pipeline
+        
+        Detection records already in memory (e.g. straight from YOLODetector)
+        can be passed as results to skip re-reading them from the CSV file.
+        """
         logger.info("Starting YOLO results loading pipeline")
         
         try:
-            # Create table
-            self.create_yolo_results_table()
-            
-            # Load CSV data
-            df = self.load_csv_results(csv_file)
-            
-            if df.empty:
-                logger.warning("No data found in CSV file")
-                return
-            
-            # Validate data
-            valid_df = self.validate_yolo_data(df)
-            
-            if valid_df.empty:
-                logger.error("No valid data after validation")
-                return
-            
-            # Load to database
-            rows_loaded = self.load_to_database(valid_df)
-            
-            # Get statistics
-            stats = self.get_loading_statistics()
+            # One pooled connection for the table DDL, the load and the statistics
+            with self.engine.connect() as conn:
+                # Create table
+                with conn.begin():
+                    self.create_yolo_results_table(conn)
+                
+                # Use in-memory results when given, otherwise load CSV data
+                if results is not None:
+                    df = pd.DataFrame(results)
+                else:
+                    df = self.load_csv_results(csv_file)
+                
+                if df.empty:
+                    logger.warning("No detection results to load")
+                    return
+                
+                # Validate data
+                valid_df = self.validate_yolo_data(df)
+                
+                if valid_df.empty:
+                    logger.error("No valid data after validation")
+                    return
+                
+                # Load to database
+                with conn.begin():
+                    rows_loaded = self.load_to_database(valid_df, conn)
+                
+                # Get statistics
+                stats = self.get_loading_statistics(conn)
             
             # Log summary
             logger.info("=== YOLO Loading Summary ===")
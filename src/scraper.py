@@ -5,31 +5,48 @@ Extracts messages and images from public Telegram channels
 """
 
 import os
-import json
 import asyncio
-import logging
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+import orjson
+from asyncio_throttle import Throttler
 
 from telethon import TelegramClient
 from telethon.tl.types import MessageMediaPhoto
 from telethon.errors import FloodWait, ChatAdminRequiredError, ChannelPrivateError
 
+from utils import configure_module_logger
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/telegram_scraper.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = configure_module_logger(__name__, 'logs/telegram_scraper.log')
+
+class TelegramGate:
+    """
+    Shared pause point for all scraper coroutines
+    
+    A FloodWait on any channel means the whole account is rate limited, so
+    every coroutine waits at the gate until the longest requested wait passes.
+    """
+    
+    def __init__(self):
+        self._until = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def wait(self):
+        """Sleep until any active flood wait has expired"""
+        while (delay := self._until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+    
+    async def pause(self, seconds: float):
+        """Close the gate for the given number of seconds"""
+        async with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
 
 class TelegramScraper:
     def __init__(self):
@@ -57,7 +74,17 @@ class TelegramScraper:
         ]
         
         # Rate limiting
-        self.request_delay = 1  # seconds between requests
+        self.throttler = Throttler(rate_limit=int(os.getenv('SCRAPER_REQUESTS_PER_SECOND', '25')), period=1.0)
+        self.max_concurrent_downloads = int(os.getenv('SCRAPER_MAX_CONCURRENT_DOWNLOADS', '8'))
+        self.max_concurrent_channels = int(os.getenv('SCRAPER_MAX_CONCURRENT_CHANNELS', '4'))
+        self.max_flood_retries = int(os.getenv('SCRAPER_MAX_FLOOD_RETRIES', '3'))
+        self.gate = TelegramGate()
+        
+        # Channel image directories already created, as path strings
+        self.image_dirs: Dict[str, str] = {}
+        
+        # Message ids already written to each partition file, scanned once per process
+        self.saved_ids: Dict[Path, set] = {}
         
     async def connect(self):
         """Connect to Telegram API"""
@@ -81,38 +108,89 @@ class TelegramScraper:
         """Get date partition path for message storage"""
         return message_date.strftime('%Y-%m-%d')
     
+    def get_partition_file(self, channel_name: str, date_partition: str) -> Path:
+        """Get the JSON Lines file a channel's messages for one date are appended to"""
+        return self.raw_data_path / 'telegram_messages' / date_partition / f"{channel_name}.jsonl"
+    
+    def get_image_dir(self, channel_name: str) -> str:
+        """Get the directory a channel's images are downloaded to, creating it the first time it is asked for"""
+        if channel_name not in self.image_dirs:
+            image_dir = self.raw_data_path / 'images' / channel_name
+            image_dir.mkdir(parents=True, exist_ok=True)
+            self.image_dirs[channel_name] = str(image_dir)
+        return self.image_dirs[channel_name]
+    
+    def get_saved_ids(self, file_path: Path) -> set:
+        """Get the message ids already in a partition file, streaming it the first time it is seen"""
+        if file_path not in self.saved_ids:
+            saved_ids = set()
+            if file_path.exists():
+                try:
+                    with open(file_path, 'rb') as f:
+                        saved_ids = {orjson.loads(line)['message_id'] for line in f if line.strip()}
+                except Exception as e:
+                    logger.warning(f"Error reading existing file {file_path}: {e}")
+            self.saved_ids[file_path] = saved_ids
+        return self.saved_ids[file_path]
+    
     async def download_image(self, message, channel_name: str, message_id: int) -> Optional[str]:
         """Download image from message if present"""
         try:
             if message.media and isinstance(message.media, MessageMediaPhoto):
-                # Create channel-specific directory
-                channel_dir = self.raw_data_path / 'images' / channel_name
-                channel_dir.mkdir(parents=True, exist_ok=True)
-                
                 # Download image
-                image_path = channel_dir / f"{message_id}.jpg"
-                await self.client.download_media(message.media, str(image_path))
+                image_path = os.path.join(self.get_image_dir(channel_name), f"{message_id}.jpg")
+                async with self.throttler:
+                    await self.client.download_media(message.media, image_path)
                 logger.info(f"Downloaded image for message {message_id} from {channel_name}")
-                return str(image_path)
+                return image_path
+        except FloodWait:
+            raise
         except Exception as e:
             logger.error(f"Failed to download image for message {message_id}: {e}")
         return None
     
-    def extract_message_data(self, message, channel_name: str) -> Dict[str, Any]:
+    def extract_message_data(self, message, channel_name: str,
+                             scraped_at: Optional[datetime] = None) -> Dict[str, Any]:
         """Extract relevant data from a Telegram message"""
         return {
             'message_id': message.id,
             'channel_name': channel_name,
-            'message_date': message.date.isoformat(),
+            'message_date': message.date,
             'message_text': message.text or '',
             'has_media': bool(message.media),
             'views': getattr(message, 'views', 0),
             'forwards': getattr(message, 'forwards', 0),
-            'scraped_at': datetime.now().isoformat()
+            'scraped_at': scraped_at or datetime.now()
         }
     
-    async def scrape_channel_messages(self, channel_name: str, limit: int = 1000):
-        """Scrape messages from a specific channel"""
+    async def attach_image(self, message, channel_name: str, message_data: Dict[str, Any],
+                           semaphore: asyncio.Semaphore, file_path: Optional[Path] = None,
+                           message_queue: Optional[asyncio.Queue] = None):
+        """Download a message's image under the download semaphore, then record its path and queue the message"""
+        async with semaphore:
+            for attempt in range(self.max_flood_retries + 1):
+                await self.gate.wait()
+                try:
+                    image_path = await self.download_image(message, channel_name, message.id)
+                    if image_path:
+                        message_data['image_path'] = image_path
+                    break
+                except FloodWait as e:
+                    logger.warning(f"Rate limited. Pausing all channels for {e.seconds} seconds...")
+                    await self.gate.pause(e.seconds)
+        
+        if message_queue is not None:
+            await message_queue.put({**message_data, 'file_path': str(file_path)})
+    
+    async def scrape_channel_messages(self, channel_name: str, limit: int = 1000,
+                                      message_queue: Optional[asyncio.Queue] = None):
+        """
+        Scrape messages from a specific channel
+        
+        When a message_queue is given, each parsed message is also put on it
+        (tagged with its checkpoint file) so a consumer can load it while
+        scraping continues.
+        """
         logger.info(f"Starting to scrape channel: {channel_name}")
         
         try:
@@ -122,34 +200,48 @@ class TelegramScraper:
             messages_data = []
             message_count = 0
             
-            # Iterate through messages
-            async for message in self.client.iter_messages(channel, limit=limit):
-                try:
-                    # Extract message data
-                    message_data = self.extract_message_data(message, channel_name)
-                    
-                    # Download image if present
-                    if message_data['has_media']:
-                        image_path = await self.download_image(message, channel_name, message.id)
-                        if image_path:
-                            message_data['image_path'] = image_path
-                    
-                    messages_data.append(message_data)
-                    message_count += 1
-                    
-                    # Log progress every 100 messages
-                    if message_count % 100 == 0:
-                        logger.info(f"Scraped {message_count} messages from {channel_name}")
-                    
-                    # Rate limiting
-                    await asyncio.sleep(self.request_delay)
-                    
-                except FloodWait as e:
-                    logger.warning(f"Rate limited. Waiting {e.seconds} seconds...")
-                    await asyncio.sleep(e.seconds)
-                except Exception as e:
-                    logger.error(f"Error processing message {message.id}: {e}")
-                    continue
+            # One scrape timestamp for the whole channel run
+            scraped_at = datetime.now()
+            
+            # Images download concurrently while iteration continues; requests are paced by the throttler
+            download_semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+            download_tasks = []
+            
+            try:
+                # Iterate through messages
+                async for message in self.client.iter_messages(channel, limit=limit):
+                    await self.gate.wait()
+                    try:
+                        # Extract message data
+                        message_data = self.extract_message_data(message, channel_name, scraped_at)
+                        messages_data.append(message_data)
+                        message_count += 1
+                        
+                        # Checkpoint file streamed messages are tagged with
+                        file_path = None
+                        if message_queue is not None:
+                            file_path = self.get_partition_file(channel_name, self.get_date_partition(message.date))
+                        
+                        # Download image if present; the message is queued once its image path is known
+                        if message_data['has_media']:
+                            download_tasks.append(asyncio.create_task(self.attach_image(
+                                message, channel_name, message_data, download_semaphore, file_path, message_queue
+                            )))
+                        elif message_queue is not None:
+                            await message_queue.put({**message_data, 'file_path': str(file_path)})
+                        
+                        # Log progress every 100 messages
+                        if message_count % 100 == 0:
+                            logger.info(f"Scraped {message_count} messages from {channel_name}")
+                        
+                    except Exception as e:
+                        logger.error(f"Error processing message {message.id}: {e}")
+                        continue
+                
+                await asyncio.gather(*download_tasks)
+            finally:
+                for task in download_tasks:
+                    task.cancel()
             
             # Save messages to JSON file
             await self.save_channel_messages(channel_name, messages_data)
@@ -157,6 +249,9 @@ class TelegramScraper:
             logger.info(f"Completed scraping {channel_name}. Total messages: {len(messages_data)}")
             return messages_data
             
+        except FloodWait:
+            # Let the caller back off and retry the whole channel
+            raise
         except ChatAdminRequiredError:
             logger.error(f"Admin access required for channel {channel_name}")
         except ChannelPrivateError:
@@ -167,15 +262,14 @@ class TelegramScraper:
         return []
     
     async def save_channel_messages(self, channel_name: str, messages: List[Dict[str, Any]]):
-        """Save messages to partitioned JSON files"""
+        """Append messages to partitioned JSON Lines files"""
         if not messages:
             return
         
         # Group messages by date
         messages_by_date = {}
         for message in messages:
-            message_date = datetime.fromisoformat(message['message_date'].replace('Z', '+00:00'))
-            date_partition = self.get_date_partition(message_date)
+            date_partition = self.get_date_partition(message['message_date'])
             
             if date_partition not in messages_by_date:
                 messages_by_date[date_partition] = []
@@ -183,43 +277,53 @@ class TelegramScraper:
         
         # Save each date's messages to separate file
         for date_partition, date_messages in messages_by_date.items():
-            date_dir = self.raw_data_path / 'telegram_messages' / date_partition
-            date_dir.mkdir(parents=True, exist_ok=True)
+            file_path = self.get_partition_file(channel_name, date_partition)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
             
-            file_path = date_dir / f"{channel_name}.json"
-            
-            # Load existing messages if file exists
-            existing_messages = []
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        existing_messages = json.load(f)
-                except Exception as e:
-                    logger.warning(f"Error reading existing file {file_path}: {e}")
-            
-            # Merge new messages with existing ones (avoid duplicates)
-            existing_ids = {msg['message_id'] for msg in existing_messages}
-            new_messages = [msg for msg in date_messages if msg['message_id'] not in existing_ids]
+            # Skip messages already in the file, then append the rest (one JSON document per line)
+            saved_ids = self.get_saved_ids(file_path)
+            new_messages = [msg for msg in date_messages if msg['message_id'] not in saved_ids]
             
             if new_messages:
-                all_messages = existing_messages + new_messages
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_messages, f, ensure_ascii=False, indent=2)
+                # Datetimes are written as ISO 8601 strings by orjson
+                with open(file_path, 'ab') as f:
+                    f.write(b''.join(orjson.dumps(msg) + b'\n' for msg in new_messages))
+                saved_ids.update(msg['message_id'] for msg in new_messages)
                 logger.info(f"Saved {len(new_messages)} new messages to {file_path}")
     
-    async def scrape_all_channels(self, limit_per_channel: int = 1000):
-        """Scrape all configured channels"""
+    async def scrape_channel_with_backoff(self, channel_name: str, limit: int, semaphore: asyncio.Semaphore,
+                                          message_queue: Optional[asyncio.Queue] = None):
+        """Scrape one channel under the shared semaphore, honouring Telegram flood waits"""
+        for attempt in range(self.max_flood_retries + 1):
+            await self.gate.wait()
+            try:
+                async with semaphore:
+                    return await self.scrape_channel_messages(channel_name, limit, message_queue)
+            except FloodWait as e:
+                # Pause every channel, not just this one, so retries don't pile onto the limit
+                await self.gate.pause(e.seconds)
+                if attempt == self.max_flood_retries:
+                    logger.error(f"Giving up on {channel_name} after {attempt + 1} flood waits")
+                    break
+                logger.warning(f"Rate limited on {channel_name}. Pausing all channels for {e.seconds} seconds...")
+            except Exception as e:
+                logger.error(f"Failed to scrape channel {channel_name}: {e}")
+                break
+        return []
+    
+    async def scrape_all_channels(self, limit_per_channel: int = 1000,
+                                  message_queue: Optional[asyncio.Queue] = None):
+        """Scrape all configured channels concurrently"""
         logger.info("Starting to scrape all channels")
         
         try:
             await self.connect()
             
-            for channel_name in self.channels:
-                try:
-                    await self.scrape_channel_messages(channel_name, limit_per_channel)
-                except Exception as e:
-                    logger.error(f"Failed to scrape channel {channel_name}: {e}")
-                    continue
+            semaphore = asyncio.Semaphore(self.max_concurrent_channels)
+            await asyncio.gather(*(
+                self.scrape_channel_with_backoff(channel_name, limit_per_channel, semaphore, message_queue)
+                for channel_name in self.channels
+            ))
             
             logger.info("Completed scraping all channels")
             
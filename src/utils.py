@@ -2,14 +2,57 @@
 Utility functions for the Telegram scraper
 """
 
-import json
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp'})
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+REQUIRED_MESSAGE_FIELDS = frozenset({'message_id', 'channel_name', 'message_date', 'message_text'})
+
+def configure_module_logger(name: str, log_file: str, queued: bool = False) -> logging.Logger:
+    """
+    Attach file and console handlers to a module's own logger
+    
+    The handlers go on the named logger rather than the root, so importing
+    several src modules into one process (the Dagster pipeline) keeps each
+    module's records in its own log file. With queued, records are formatted
+    on the calling thread and written by a QueueListener thread. Existing
+    handlers are replaced, so calling it again reconfigures the logger.
+    """
+    module_logger = logging.getLogger(name)
+    module_logger.setLevel(logging.INFO)
+    module_logger.propagate = False
+    for handler in module_logger.handlers[:]:
+        module_logger.removeHandler(handler)
+    
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    if queued:
+        log_queue = queue.Queue(-1)
+        log_listener = QueueListener(log_queue, *handlers)
+        log_listener.start()
+        atexit.register(log_listener.stop)
+        handlers = [QueueHandler(log_queue)]
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        module_logger.addHandler(handler)
+    return module_logger
+
 def ensure_directory(path: Path) -> None:
     """Ensure directory exists, create if it doesn't"""
     path.mkdir(parents=True, exist_ok=True)
@@ -18,8 +61,7 @@ def load_json_file(file_path: Path) -> List[Dict[str, Any]]:
     """Load and parse JSON file"""
     try:
         if file_path.exists():
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return orjson.loads(file_path.read_bytes())
     except Exception as e:
         logger.error(f"Error loading JSON file {file_path}: {e}")
     return []
@@ -28,8 +70,8 @@ def save_json_file(data: List[Dict[str, Any]], file_path: Path) -> bool:
     """Save data to JSON file"""
     try:
         ensure_directory(file_path.parent)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # orjson writes UTF-8 and serializes datetimes as ISO 8601 strings
+        file_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
         return True
     except Exception as e:
         logger.error(f"Error saving JSON file {file_path}: {e}")
@@ -41,26 +83,28 @@ def get_date_partition(message_date: datetime) -> str:
 
 def validate_message_data(message_data: Dict[str, Any]) -> bool:
     """Validate that required message fields are present"""
-    required_fields = ['message_id', 'channel_name', 'message_date', 'message_text']
-    return all(field in message_data for field in required_fields)
+    return REQUIRED_MESSAGE_FIELDS <= message_data.keys()
 
 def deduplicate_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Remove duplicate messages based on message_id and channel_name"""
-    seen = set()
-    unique_messages = []
-    
+    """Remove duplicate messages based on message_id and channel_name, keeping the first of each"""
+    unique_messages = {}
     for message in messages:
-        key = (message['message_id'], message['channel_name'])
-        if key not in seen:
-            seen.add(key)
-            unique_messages.append(message)
-    
-    return unique_messages
+        unique_messages.setdefault((message['message_id'], message['channel_name']), message)
+    return list(unique_messages.values())
+
+def iter_image_files(root: Path, extensions: frozenset = IMAGE_EXTENSIONS) -> Iterator[Path]:
+    """Yield image files under root as a single directory walk finds them"""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in extensions:
+                yield Path(dirpath) / filename
+
+def find_image_files(root: Path, extensions: frozenset = IMAGE_EXTENSIONS) -> List[Path]:
+    """Find image files under root in a single directory walk"""
+    return list(iter_image_files(root, extensions))
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.1f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.1f} TB"
+    # Each unit is 10 more bits, so the unit index comes straight from the bit length
+    unit = min((max(int(size_bytes), 1).bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (10 * unit)):.1f} {SIZE_UNITS[unit]}"
@@ -5,30 +5,79 @@ Analyzes downloaded Telegram images to detect objects and classify content
 """
 
 import os
+import re
+import queue
 import json
+import random
 import csv
-import logging
+import shutil
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
-import pandas as pd
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional
+import numpy as np
 from ultralytics import YOLO
 import cv2
 from dotenv import load_dotenv
 
+from utils import configure_module_logger, find_image_files, iter_image_files
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/yolo_detection.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Configure logging: records are formatted on the calling thread and written by a listener thread
+logger = configure_module_logger(__name__, 'logs/yolo_detection.log', queued=True)
+
+# Channel and message ID of an image path (.../images/channel_name/message_id.jpg) in one match
+IMAGE_METADATA_PATTERN = re.compile(r'(?:^|[\\/])images[\\/]+([^\\/]+)[\\/](?:.*[\\/])?(\d+)\.[^.\\/]+$')
+
+class DetectionStatistics:
+    """Summary statistics over detection results, accumulated one record at a time"""
+    
+    def __init__(self):
+        self.images = 0
+        self.categories = Counter()
+        self.channels = Counter()
+        self.top_classes = Counter()
+        self.detections_total = 0
+        self.detections_max = 0
+        self.max_confidence_total = 0.0
+        self.images_with_persons = 0
+        self.images_with_products = 0
+    
+    def add(self, result: Dict[str, Any]):
+        """Fold one detection result into the running totals"""
+        self.images += 1
+        self.categories[result['image_category']] += 1
+        self.channels[result['channel_name']] += 1
+        if result['top_class'] is not None:
+            self.top_classes[result['top_class']] += 1
+        self.detections_total += result['total_detections']
+        self.detections_max = max(self.detections_max, result['total_detections'])
+        self.max_confidence_total += result['max_confidence']
+        self.images_with_persons += result['person_count'] > 0
+        self.images_with_products += result['product_count'] > 0
+    
+    def summary(self) -> Dict[str, Any]:
+        """Summary statistics in the shape written to detection_statistics.json"""
+        if not self.images:
+            return {}
+        
+        return {
+            'total_images_processed': self.images,
+            'image_categories': dict(self.categories.most_common()),
+            'channels_processed': len(self.channels),
+            'images_per_channel': dict(self.channels.most_common()),
+            'avg_detections_per_image': self.detections_total / self.images,
+            'max_detections_per_image': self.detections_max,
+            'avg_confidence': self.max_confidence_total / self.images,
+            'top_detected_classes': dict(self.top_classes.most_common(10)),
+            'person_detection_rate': self.images_with_persons / self.images * 100,
+            'product_detection_rate': self.images_with_products / self.images * 100
+        }
 
 class YOLODetector:
     def __init__(self, model_name: str = 'yolov8n.pt'):
@@ -38,7 +87,48 @@ class YOLODetector:
         self.raw_data_path = Path(os.getenv('RAW_DATA_PATH', 'data/raw'))
         self.images_path = self.raw_data_path / 'images'
         self.results_path = Path('results')
+        
+        # Filtering happens inside the model's NMS, so only boxes that are kept reach Python
         self.confidence_threshold = 0.25
+        self.iou_threshold = 0.45
+        self.max_detections = 100
+        
+        # Batched inference settings
+        self.batch_size = int(os.getenv('YOLO_BATCH_SIZE', '32'))
+        self.image_size = int(os.getenv('YOLO_IMAGE_SIZE', '640'))
+        self.device = os.getenv('YOLO_DEVICE') or None
+        
+        # With several GPUs visible (and no YOLO_DEVICE pinned), each one gets its own worker process
+        self.multi_gpu = os.getenv('YOLO_MULTI_GPU', '1') != '0'
+        
+        # Opt-in: JPEGs are decoded by nvJPEG on the GPU when the model runs on CUDA. Frames still
+        # come back to the host at full size for Ultralytics' letterbox, so measure before enabling
+        self.use_nvjpeg = os.getenv('YOLO_NVJPEG', '0') == '1'
+        self.gpu_decode = False
+        
+        # Result records are built on a thread pool while the model works on the next batch
+        self.postprocess_workers = int(os.getenv('YOLO_POSTPROCESS_WORKERS', '4'))
+        
+        # PyTorch weights on CUDA are compiled (CUDA graphs via reduce-overhead) by prepare_model
+        self.use_compile = os.getenv('YOLO_COMPILE', '1') != '0'
+        self.images_found = 0
+        
+        # Reruns skip images that already have a row in the results CSV and append to it
+        self.resume = os.getenv('YOLO_RESUME', '1') != '0'
+        self.images_skipped = 0
+        
+        # TensorRT engine (fp16, or int8 calibrated on downloaded images), exported once on CUDA machines and reused across runs
+        self.use_tensorrt = os.getenv('YOLO_TENSORRT', '1') != '0'
+        self.precision = os.getenv('YOLO_PRECISION', 'fp16')
+        if self.precision not in ('fp16', 'int8'):
+            raise ValueError(f"YOLO_PRECISION must be 'fp16' or 'int8', got {self.precision!r}")
+        self.calibration_images = int(os.getenv('YOLO_CALIBRATION_IMAGES', '200'))
+        self.engine_path = self.results_path / f"{Path(model_name).stem}_b{self.batch_size}_{self.image_size}_{self.precision}.engine"
+        self.engine_loaded = False
+        
+        # OpenVINO model for CPU-only hosts; batches run as concurrent THROUGHPUT-mode infer requests
+        self.use_openvino = os.getenv('YOLO_OPENVINO', '1') != '0'
+        self.openvino_path = self.results_path / f"{Path(model_name).stem}_{self.image_size}_{self.precision}_openvino_model"
         
         # Create results directory
         self.results_path.mkdir(exist_ok=True)
@@ -60,54 +150,151 @@ class YOLODetector:
         }
     
     def load_model(self):
-        """Load YOLO model"""
+        """Load YOLO model, as a TensorRT engine when running on CUDA or an OpenVINO model on CPU"""
         try:
-            logger.info(f"Loading YOLO model: {self.model_name}")
-            self.model = YOLO(self.model_name)
+            engine_path = None
+            if self.use_half_precision():
+                if self.use_tensorrt:
+                    engine_path = self.export_tensorrt_engine()
+            elif self.use_openvino:
+                engine_path = self.export_openvino_model()
+            
+            if engine_path:
+                logger.info(f"Loading exported model: {engine_path}")
+                self.model = YOLO(str(engine_path), task='detect')
+            else:
+                logger.info(f"Loading YOLO model: {self.model_name}")
+                self.model = YOLO(self.model_name)
+            self.engine_loaded = engine_path is not None
+            self.gpu_decode = self.use_nvjpeg and self.use_half_precision()
+            self.build_class_masks()
             logger.info("Model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
             raise
     
+    def write_calibration_config(self, model: YOLO) -> Optional[Path]:
+        """Write a dataset config listing a random sample of downloaded images for INT8 calibration"""
+        images = self.find_images()
+        if not images:
+            return None
+        
+        calibration_dir = self.results_path / 'calibration'
+        calibration_dir.mkdir(exist_ok=True)
+        image_list = calibration_dir / 'images.txt'
+        sample = random.sample(images, min(self.calibration_images, len(images)))
+        image_list.write_text('\n'.join(str(path.resolve()) for path in sample))
+        
+        # JSON is valid YAML, so the config needs no YAML writer
+        config_path = calibration_dir / 'calib.yaml'
+        config_path.write_text(json.dumps({
+            'path': str(calibration_dir.resolve()),
+            'train': image_list.name,
+            'val': image_list.name,
+            'names': model.names
+        }))
+        return config_path
+    
+    def export_tensorrt_engine(self) -> Optional[Path]:
+        """Export the model to a dynamic-batch TensorRT engine unless already cached; None if export fails"""
+        if self.engine_path.exists():
+            return self.engine_path
+        
+        try:
+            logger.info(f"Exporting {self.model_name} to {self.precision} TensorRT (batch {self.batch_size}, imgsz {self.image_size})")
+            model = YOLO(self.model_name)
+            if self.precision == 'int8':
+                calibration_config = self.write_calibration_config(model)
+                if calibration_config is None:
+                    logger.warning("No downloaded images to calibrate INT8 with, falling back to PyTorch weights")
+                    return None
+                precision_args = {'int8': True, 'data': str(calibration_config)}
+            else:
+                precision_args = {'half': True}
+            
+            exported_path = model.export(
+                format='engine',
+                dynamic=True,
+                batch=self.batch_size,
+                imgsz=self.image_size,
+                device=self.device or 0,
+                **precision_args
+            )
+            shutil.move(exported_path, self.engine_path)
+            return self.engine_path
+        except Exception as e:
+            logger.warning(f"TensorRT export failed, falling back to PyTorch weights: {e}")
+            return None
+    
+    def export_openvino_model(self) -> Optional[Path]:
+        """Export the model to an OpenVINO IR directory unless already cached; None if export fails"""
+        if self.openvino_path.exists():
+            return self.openvino_path
+        
+        try:
+            logger.info(f"Exporting {self.model_name} to {self.precision} OpenVINO (imgsz {self.image_size})")
+            model = YOLO(self.model_name)
+            if self.precision == 'int8':
+                calibration_config = self.write_calibration_config(model)
+                if calibration_config is None:
+                    logger.warning("No downloaded images to calibrate INT8 with, falling back to PyTorch weights")
+                    return None
+                precision_args = {'int8': True, 'data': str(calibration_config)}
+            else:
+                precision_args = {'half': True}
+            
+            # Dynamic shapes let one IR serve the last, partial batch too
+            exported_path = model.export(
+                format='openvino',
+                dynamic=True,
+                imgsz=self.image_size,
+                **precision_args
+            )
+            shutil.move(exported_path, self.openvino_path)
+            return self.openvino_path
+        except Exception as e:
+            logger.warning(f"OpenVINO export failed, falling back to PyTorch weights: {e}")
+            return None
+    
     def find_images(self) -> List[Path]:
         """Find all downloaded images"""
-        images = []
-        
         if not self.images_path.exists():
             logger.warning(f"Images directory not found: {self.images_path}")
-            return images
+            return []
         
         # Find all image files
-        for ext in ['*.jpg', '*.jpeg', '*.png', '*.bmp']:
-            images.extend(self.images_path.rglob(ext))
+        images = find_image_files(self.images_path)
         
         logger.info(f"Found {len(images)} images to process")
         return images
     
-    def extract_message_id_from_path(self, image_path: Path) -> Optional[int]:
-        """Extract message ID from image path"""
-        try:
-            # Extract message_id from filename (e.g., "12345.jpg")
-            filename = image_path.stem
-            return int(filename)
-        except (ValueError, AttributeError):
-            logger.warning(f"Could not extract message ID from path: {image_path}")
-            return None
+    def iter_images(self) -> Iterator[Path]:
+        """Yield downloaded images as the directory walk finds them"""
+        if not self.images_path.exists():
+            logger.warning(f"Images directory not found: {self.images_path}")
+            return iter(())
+        return iter_image_files(self.images_path)
     
-    def extract_channel_from_path(self, image_path: Path) -> Optional[str]:
-        """Extract channel name from image path"""
-        try:
-            # Path structure: data/raw/images/channel_name/message_id.jpg
-            parts = image_path.parts
-            if 'images' in parts:
-                channel_idx = parts.index('images') + 1
-                if channel_idx < len(parts):
-                    return parts[channel_idx]
-        except (IndexError, AttributeError):
-            logger.warning(f"Could not extract channel from path: {image_path}")
-        return None
-    
-    def classify_image_content(self, detections: List[Dict[str, Any]]) -> str:
+    def extract_metadata_from_path(self, image_path: Path) -> Tuple[Optional[str], Optional[int]]:
+        """Extract (channel_name, message_id) from an image path, or (None, None) if it doesn't match"""
+        # Path structure: data/raw/images/channel_name/message_id.jpg
+        match = IMAGE_METADATA_PATTERN.search(str(image_path))
+        if match is None:
+            logger.warning(f"Could not extract channel and message ID from path: {image_path}")
+            return None, None
+        return match[1], int(match[2])
+    
+    def build_class_masks(self):
+        """Build lookup tables over the loaded model's class ids: class names and boolean membership masks"""
+        num_classes = max(self.model.names) + 1
+        self.class_names = tuple(self.model.names.get(class_id) for class_id in range(num_classes))
+        self.person_class_mask = np.zeros(num_classes, dtype=bool)
+        self.product_class_mask = np.zeros(num_classes, dtype=bool)
+        for class_id, name in self.model.names.items():
+            self.person_class_mask[class_id] = name in self.person_classes
+            self.product_class_mask[class_id] = name in self.product_classes
+    
+    def classify_image_content(self, class_ids: np.ndarray) -> str:
         """
         Classify image based on detected objects:
         - promotional: Contains person + product
@@ -115,19 +302,9 @@ class YOLODetector:
         - lifestyle: Contains person, no product
         - other: Neither detected
         """
-        has_person = False
-        has_product = False
-        
-        for detection in detections:
-            class_name = detection['class_name']
-            confidence = detection['confidence']
-            
-            # Only consider detections above threshold
-            if confidence >= self.confidence_threshold:
-                if class_name in self.person_classes:
-                    has_person = True
-                if class_name in self.product_classes:
-                    has_product = True
+        # Detections are already above the confidence threshold (applied in the model call)
+        has_person = bool(self.person_class_mask[class_ids].any())
+        has_product = bool(self.product_class_mask[class_ids].any())
         
         # Classification logic
         if has_person and has_product:
@@ -139,60 +316,265 @@ class YOLODetector:
         else:
             return 'other'
     
-    def detect_objects(self, image_path: Path) -> List[Dict[str, Any]]:
+    def prepare_model(self):
+        """
+        Load the model and optimize it for repeated inference
+        
+        PyTorch weights get their Conv+BN layers fused and, on CUDA, are
+        compiled with torch.compile and warmed up with one full batch so the
+        first real batch pays no compile cost. Exported TensorRT engines and
+        OpenVINO models are already fused at export time and are left as is.
+        """
+        self.load_model()
+        if self.engine_loaded:
+            return
+        
+        self.model.fuse()
+        if not (self.use_compile and self.use_half_precision()):
+            return
+        
+        import torch
+        try:
+            self.model.model = torch.compile(self.model.model, mode='reduce-overhead', fullgraph=False)
+            warmup = [np.zeros((self.image_size, self.image_size, 3), dtype=np.uint8)] * self.batch_size
+            for _ in self.model.predict(source=warmup, batch=self.batch_size, imgsz=self.image_size,
+                                        half=True, device=self.device, stream=True, verbose=False):
+                pass
+            logger.info("Model compiled with torch.compile")
+        except Exception as e:
+            logger.warning(f"torch.compile failed, running the fused model uncompiled: {e}")
+            self.model.model = getattr(self.model.model, '_orig_mod', self.model.model)
+    
+    def use_half_precision(self) -> bool:
+        """FP16 inference only pays off (and is only supported) on a CUDA device"""
+        import torch
+        return torch.cuda.is_available() and self.device != 'cpu'
+    
+    def empty_detections(self) -> Dict[str, np.ndarray]:
+        """Detection arrays for an image with no detections"""
+        return {
+            'cls': np.empty(0, dtype=np.int64),
+            'conf': np.empty(0, dtype=np.float32),
+            'xyxy': np.empty((0, 4), dtype=np.float32)
+        }
+    
+    def extract_detections(self, result) -> Dict[str, np.ndarray]:
+        """Move one Ultralytics result's class ids, confidences and boxes to the host as arrays"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return self.empty_detections()
+        
+        return {
+            'cls': boxes.cls.cpu().numpy().astype(np.int64),
+            'conf': boxes.conf.cpu().numpy(),
+            'xyxy': boxes.xyxy.cpu().numpy()
+        }
+    
+    def detections_to_records(self, detections: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Expand detection arrays into per-box records for the detailed JSON output"""
+        x1, y1, x2, y2 = detections['xyxy'].astype(np.float64).T
+        widths = x2 - x1
+        heights = y2 - y1
+        
+        class_names = self.class_names
+        names = [class_names[class_id] for class_id in detections['cls'].tolist()]
+        return [
+            {
+                'class_name': name,
+                'confidence': confidence,
+                'bbox_x1': bx1,
+                'bbox_y1': by1,
+                'bbox_x2': bx2,
+                'bbox_y2': by2,
+                'bbox_width': width,
+                'bbox_height': height,
+                'bbox_area': area
+            }
+            for name, confidence, bx1, by1, bx2, by2, width, height, area in zip(
+                names, detections['conf'].tolist(), x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist(),
+                widths.tolist(), heights.tolist(), (widths * heights).tolist()
+            )
+        ]
+    
+    def detect_objects(self, image_path: Path) -> Dict[str, np.ndarray]:
         """Run YOLO detection on a single image"""
         try:
             # Run inference
-            results = self.model(image_path, verbose=False)
-            
-            detections = []
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Extract detection information
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        class_name = self.model.names[class_id]
-                        
-                        # Bounding box coordinates
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        
-                        detection = {
-                            'class_name': class_name,
-                            'confidence': confidence,
-                            'bbox_x1': x1,
-                            'bbox_y1': y1,
-                            'bbox_x2': x2,
-                            'bbox_y2': y2,
-                            'bbox_width': x2 - x1,
-                            'bbox_height': y2 - y1,
-                            'bbox_area': (x2 - x1) * (y2 - y1)
-                        }
-                        detections.append(detection)
-            
-            return detections
+            results = self.model(
+                image_path,
+                conf=self.confidence_threshold,
+                iou=self.iou_threshold,
+                max_det=self.max_detections,
+                verbose=False
+            )
+            return self.extract_detections(results[0])
             
         except Exception as e:
             logger.error(f"Error processing image {image_path}: {e}")
+            return self.empty_detections()
+    
+    def read_jpeg_on_gpu(self, image_path: Path) -> np.ndarray:
+        """Decode a JPEG with nvJPEG and return it as a host BGR array, the layout cv2.imread produces"""
+        import torchvision
+        from torchvision.io import ImageReadMode
+        
+        data = torchvision.io.read_file(str(image_path))
+        image = torchvision.io.decode_jpeg(data, mode=ImageReadMode.RGB, device=self.cuda_device())
+        return image.flip(0).permute(1, 2, 0).contiguous().cpu().numpy()
+    
+    def cuda_device(self) -> str:
+        """Torch device string for the model's GPU; YOLO_DEVICE uses Ultralytics' form ('0', '0,1', 'cuda:1')"""
+        if not self.device:
+            return 'cuda'
+        first_device = self.device.split(',')[0].strip()
+        return f'cuda:{first_device}' if first_device.isdigit() else first_device
+    
+    def read_image(self, image_path: Path) -> Optional[np.ndarray]:
+        """Decode one image into a BGR array, or None if it can't be read"""
+        # nvJPEG only covers JPEG; other formats (and JPEGs it rejects) go through OpenCV
+        if self.gpu_decode and image_path.suffix.lower() in ('.jpg', '.jpeg'):
+            try:
+                return self.read_jpeg_on_gpu(image_path)
+            except RuntimeError:
+                pass
+        return cv2.imread(str(image_path))
+    
+    def read_images(self, image_paths: List[Path]) -> list:
+        """Decode a batch of images into BGR arrays; unreadable files fail the batch's inference"""
+        frames = [self.read_image(path) for path in image_paths]
+        if any(frame is None for frame in frames):
+            raise ValueError("could not decode every image in the batch")
+        return frames
+    
+    def detect_objects_batched(self, image_paths: Iterable[Path]):
+        """
+        Run YOLO detection over images in mini-batches
+        
+        Yields (image_path, detections) pairs. Paths are consumed lazily and
+        results are streamed, so only one batch is held in memory at a time
+        while the next one is decoded on a background thread.
+        """
+        half = self.use_half_precision()
+        image_paths = iter(image_paths)
+        batches = iter(lambda: list(islice(image_paths, self.batch_size)), [])
+        start = 0
+        
+        # Double buffering: decode batch n+1 (cv2 releases the GIL) while batch n is on the model
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            batch = next(batches, None)
+            pending = reader.submit(self.read_images, batch) if batch else None
+            while batch:
+                current, frames_future = batch, pending
+                batch = next(batches, None)
+                pending = reader.submit(self.read_images, batch) if batch else None
+                
+                done = 0
+                try:
+                    results = self.model.predict(
+                        source=frames_future.result(),
+                        batch=self.batch_size,
+                        imgsz=self.image_size,
+                        conf=self.confidence_threshold,
+                        iou=self.iou_threshold,
+                        max_det=self.max_detections,
+                        half=half,
+                        device=self.device,
+                        stream=True,
+                        verbose=False
+                    )
+                    for image_path, result in zip(current, results):
+                        detections = self.extract_detections(result)
+                        done += 1
+                        yield image_path, detections
+                except Exception as e:
+                    # Fall back to per-image inference so one bad file doesn't drop the batch
+                    logger.error(f"Batched inference failed for images {start + 1}-{start + len(current)}: {e}")
+                    for image_path in current[done:]:
+                        yield image_path, self.detect_objects(image_path)
+                start += len(current)
+    
+    def shard_devices(self) -> List[str]:
+        """CUDA devices to shard detection across; empty unless sharding is enabled and several GPUs are visible"""
+        import torch
+        if not self.multi_gpu or self.device is not None:
             return []
+        device_count = torch.cuda.device_count()
+        return [f'cuda:{index}' for index in range(device_count)] if device_count > 1 else []
+    
+    def detect_objects_sharded(self, image_paths: Iterable[Path], devices: List[str]):
+        """
+        Run YOLO detection with one worker process per GPU
+        
+        Yields (image_path, detections) pairs in completion order. Path batches
+        are handed out from a shared queue as workers finish earlier ones, with
+        at most two batches per GPU in flight.
+        """
+        # CUDA cannot be re-initialised in a forked child
+        context = multiprocessing.get_context('spawn')
+        batch_queue = context.Queue()
+        result_queue = context.Queue()
+        workers = [
+            context.Process(target=detection_worker, args=(self.model_name, device, batch_queue, result_queue), daemon=True)
+            for device in devices
+        ]
+        for worker in workers:
+            worker.start()
+        logger.info(f"Sharding detection across {len(workers)} GPUs")
+        
+        image_paths = iter(image_paths)
+        batches = iter(lambda: list(islice(image_paths, self.batch_size)), [])
+        in_flight = 0
+        try:
+            for batch in islice(batches, 2 * len(workers)):
+                batch_queue.put(batch)
+                in_flight += 1
+            
+            while in_flight:
+                try:
+                    pairs = result_queue.get(timeout=30)
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in workers):
+                        raise RuntimeError("A detection worker process exited unexpectedly")
+                    continue
+                in_flight -= 1
+                
+                batch = next(batches, None)
+                if batch:
+                    batch_queue.put(batch)
+                    in_flight += 1
+                yield from pairs
+        finally:
+            for _ in workers:
+                batch_queue.put(None)
+            for worker in workers:
+                worker.join(timeout=60)
+                if worker.is_alive():
+                    worker.terminate()
     
     def process_single_image(self, image_path: Path) -> Optional[Dict[str, Any]]:
         """Process a single image and return detection results"""
+        # Extract metadata
+        channel_name, message_id = self.extract_metadata_from_path(image_path)
+        
+        if message_id is None or channel_name is None:
+            logger.warning(f"Skipping image due to missing metadata: {image_path}")
+            return None
+        
+        # Run object detection through the batched path as a batch of one
+        _, detections = next(self.detect_objects_batched([image_path]))
+        
+        return self.build_result(image_path, message_id, channel_name, detections)
+    
+    def build_result(self, image_path: Path, message_id: int, channel_name: str,
+                     detections: Dict[str, np.ndarray]) -> Optional[Dict[str, Any]]:
+        """Build the result record for one image from its detection arrays"""
         try:
-            # Extract metadata
-            message_id = self.extract_message_id_from_path(image_path)
-            channel_name = self.extract_channel_from_path(image_path)
-            
-            if message_id is None or channel_name is None:
-                logger.warning(f"Skipping image due to missing metadata: {image_path}")
-                return None
-            
-            # Run object detection
-            detections = self.detect_objects(image_path)
+            class_ids = detections['cls']
+            confidences = detections['conf']
+            total_detections = len(class_ids)
             
             # Classify image content
-            image_category = self.classify_image_content(detections)
+            image_category = self.classify_image_content(class_ids)
             
             # Create result record
             result = {
@@ -200,31 +582,29 @@ class YOLODetector:
                 'channel_name': channel_name,
                 'image_path': str(image_path),
                 'image_category': image_category,
-                'total_detections': len(detections),
+                'total_detections': total_detections,
                 'processing_timestamp': datetime.now().isoformat(),
-                'detections_json': json.dumps(detections) if detections else None
+                'detections_json': json.dumps(self.detections_to_records(detections)) if total_detections else None
             }
             
-            # Add detection-specific fields
-            person_detections = [d for d in detections if d['class_name'] in self.person_classes]
-            product_detections = [d for d in detections if d['class_name'] in self.product_classes]
-            
-            result.update({
-                'person_count': len(person_detections),
-                'product_count': len(product_detections),
-                'max_confidence': max([d['confidence'] for d in detections]) if detections else 0.0,
-                'avg_confidence': sum([d['confidence'] for d in detections]) / len(detections) if detections else 0.0
-            })
-            
-            # Add top detection
-            if detections:
-                top_detection = max(detections, key=lambda x: x['confidence'])
+            # Add detection-specific fields and the top detection; the argmax doubles as the max
+            if total_detections:
+                top_index = int(confidences.argmax())
+                top_confidence = float(confidences[top_index])
                 result.update({
-                    'top_class': top_detection['class_name'],
-                    'top_confidence': top_detection['confidence']
+                    'person_count': int(self.person_class_mask[class_ids].sum()),
+                    'product_count': int(self.product_class_mask[class_ids].sum()),
+                    'max_confidence': top_confidence,
+                    'avg_confidence': float(confidences.mean(dtype=np.float64)),
+                    'top_class': self.class_names[class_ids[top_index]],
+                    'top_confidence': top_confidence
                 })
             else:
                 result.update({
+                    'person_count': 0,
+                    'product_count': 0,
+                    'max_confidence': 0.0,
+                    'avg_confidence': 0.0,
                     'top_class': None,
                     'top_confidence': 0.0
                 })
@@ -235,113 +615,201 @@ class YOLODetector:
             logger.error(f"Error processing image {image_path}: {e}")
             return None
     
-    def process_all_images(self) -> List[Dict[str, Any]]:
-        """Process all images in the dataset"""
-        logger.info("Starting YOLO object detection processing")
+    def load_processed_keys(self, csv_path: Path) -> set:
+        """Read the (channel_name, message_id) keys of images already in a results CSV"""
+        if not csv_path.exists():
+            return set()
         
-        # Load model
-        self.load_model()
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            return {(row['channel_name'], int(row['message_id'])) for row in csv.DictReader(f)}
+    
+    def iter_usable_images(self, images: Iterable[Path], processed_keys: Optional[set] = None) -> Iterator[Path]:
+        """
+        Yield images whose path carries a message ID and channel, counting every image seen
         
-        # Find all images
-        images = self.find_images()
+        Images whose (channel_name, message_id) is in processed_keys already
+        have results and are skipped before they reach the model.
+        """
+        self.images_found = 0
+        self.images_skipped = 0
+        for image_path in images:
+            self.images_found += 1
+            channel_name, message_id = self.extract_metadata_from_path(image_path)
+            if message_id is None or channel_name is None:
+                logger.warning(f"Skipping image due to missing metadata: {image_path}")
+                continue
+            if processed_keys and (channel_name, message_id) in processed_keys:
+                self.images_skipped += 1
+                continue
+            yield image_path
+    
+    def finalize_result(self, image_path: Path, detections: Dict[str, np.ndarray]) -> Optional[Dict[str, Any]]:
+        """Build the result record for an image straight from its path and detection arrays"""
+        channel_name, message_id = self.extract_metadata_from_path(image_path)
+        return self.build_result(image_path, message_id, channel_name, detections)
+    
+    def iter_results(self, images: Optional[Iterable[Path]] = None,
+                     processed_keys: Optional[set] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield a detection result for each image in the dataset, or the given images if already discovered
         
-        if not images:
-            logger.warning("No images found to process")
-            return []
+        Images are streamed from the directory walk into the model, so detection
+        starts on the first batch instead of after the whole tree is listed.
+        Records are built on a thread pool, up to one batch ahead, and yielded
+        in image order.
+        """
+        logger.info("Starting YOLO object detection processing")
+        
+        # Load model unless it was preloaded (e.g. by the pipeline resource)
+        if self.model is None:
+            self.load_model()
+        
+        # Stream images from disk unless the caller already has them
+        if images is None:
+            images = self.iter_images()
         
-        results = []
         processed_count = 0
         
-        for i, image_path in enumerate(images):
-            logger.info(f"Processing image {i+1}/{len(images)}: {image_path}")
-            
-            result = self.process_single_image(image_path)
-            if result:
-                results.append(result)
-                processed_count += 1
+        usable_images = self.iter_usable_images(images, processed_keys)
+        devices = self.shard_devices()
+        if len(devices) > 1:
+            detections_stream = self.detect_objects_sharded(usable_images, devices)
+        else:
+            detections_stream = self.detect_objects_batched(usable_images)
+        
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.postprocess_workers) as postprocess_pool:
+            for i, (image_path, detections) in enumerate(detections_stream):
+                pending.append(postprocess_pool.submit(self.finalize_result, image_path, detections))
+                
+                # Drain the oldest record once a batch is queued, so the writers keep pace
+                while len(pending) > self.batch_size:
+                    result = pending.popleft().result()
+                    if result:
+                        processed_count += 1
+                        yield result
+                
+                # Log progress every 100 images
+                if (i + 1) % 100 == 0:
+                    logger.info(f"Processed {i+1} images so far")
             
-            # Log progress every 10 images
-            if (i + 1) % 10 == 0:
-                logger.info(f"Processed {i+1}/{len(images)} images")
+            while pending:
+                result = pending.popleft().result()
+                if result:
+                    processed_count += 1
+                    yield result
         
-        logger.info(f"Completed processing. Successfully processed {processed_count}/{len(images)} images")
-        return results
-    
-    def save_results_to_csv(self, results: List[Dict[str, Any]], filename: str = 'yolo_detections.csv'):
-        """Save detection results to CSV file"""
-        if not results:
-            logger.warning("No results to save")
+        if not self.images_found:
+            logger.warning("No images found to process")
             return
         
-        # Convert to DataFrame
-        df = pd.DataFrame(results)
-        
-        # Remove detections_json column for CSV (save separately if needed)
-        csv_df = df.drop('detections_json', axis=1, errors='ignore')
+        if self.images_skipped:
+            logger.info(f"Skipped {self.images_skipped} images that already have results")
+        logger.info(f"Completed processing. Successfully processed {processed_count}/{self.images_found - self.images_skipped} images")
+    
+    def process_all_images(self, images: Optional[Iterable[Path]] = None) -> List[Dict[str, Any]]:
+        """Process all images in the dataset, or the given images if already discovered"""
+        return list(self.iter_results(images))
+    
+    def save_results(self, results: Iterable[Dict[str, Any]], csv_path: Path, json_path: Path,
+                     append: bool = False) -> Tuple[List[Dict[str, Any]], DetectionStatistics]:
+        """
+        Write detection results to disk as they are produced
         
-        # Save to CSV
-        csv_path = self.results_path / filename
-        csv_df.to_csv(csv_path, index=False)
+        Each full record goes to a JSON Lines file and, without its
+        detections_json, to the CSV file; with append, both files are extended
+        instead of replaced. Returns the slim records (for the database
+        loader) and the statistics accumulated along the way.
+        """
+        records = []
+        statistics = DetectionStatistics()
         
-        logger.info(f"Results saved to {csv_path}")
-        logger.info(f"Total records: {len(csv_df)}")
+        # Appending keeps the existing CSV header (and its column order)
+        fieldnames = None
+        if append and csv_path.exists() and csv_path.stat().st_size:
+            with open(csv_path, newline='', encoding='utf-8') as f:
+                fieldnames = next(csv.reader(f), None)
+        else:
+            append = False
+        mode = 'a' if append else 'w'
         
-        return csv_path
-    
-    def save_detailed_results(self, results: List[Dict[str, Any]], filename: str = 'yolo_detections_detailed.json'):
-        """Save detailed results including detection JSON"""
-        if not results:
-            logger.warning("No detailed results to save")
-            return
+        with open(csv_path, mode, newline='', encoding='utf-8') as csv_file, \
+                open(json_path, mode, encoding='utf-8') as json_file:
+            csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames) if fieldnames else None
+            for result in results:
+                json_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                
+                # Remove detections_json for CSV (kept in the detailed file)
+                result.pop('detections_json', None)
+                if csv_writer is None:
+                    csv_writer = csv.DictWriter(csv_file, fieldnames=list(result))
+                    csv_writer.writeheader()
+                csv_writer.writerow(result)
+                
+                statistics.add(result)
+                records.append(result)
         
-        # Save detailed JSON
-        json_path = self.results_path / filename
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        if not records:
+            if not append:
+                csv_path.unlink()
+                json_path.unlink()
+            return records, statistics
         
+        logger.info(f"Results saved to {csv_path}")
         logger.info(f"Detailed results saved to {json_path}")
-        return json_path
+        logger.info(f"Total records: {len(records)}")
+        return records, statistics
     
-    def generate_summary_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate summary statistics from detection results"""
-        if not results:
-            return {}
+    def load_csv_statistics(self, csv_path: Path) -> DetectionStatistics:
+        """Accumulate statistics over every record in a results CSV, including earlier runs' rows"""
+        statistics = DetectionStatistics()
+        if not csv_path.exists():
+            return statistics
         
-        df = pd.DataFrame(results)
-        
-        stats = {
-            'total_images_processed': len(results),
-            'image_categories': df['image_category'].value_counts().to_dict(),
-            'channels_processed': df['channel_name'].nunique(),
-            'images_per_channel': df['channel_name'].value_counts().to_dict(),
-            'avg_detections_per_image': df['total_detections'].mean(),
-            'max_detections_per_image': df['total_detections'].max(),
-            'avg_confidence': df['max_confidence'].mean(),
-            'top_detected_classes': df['top_class'].value_counts().head(10).to_dict(),
-            'person_detection_rate': (df['person_count'] > 0).mean() * 100,
-            'product_detection_rate': (df['product_count'] > 0).mean() * 100
-        }
-        
-        return stats
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                statistics.add({
+                    'image_category': row['image_category'],
+                    'channel_name': row['channel_name'],
+                    'top_class': row['top_class'] or None,
+                    'total_detections': int(row['total_detections']),
+                    'max_confidence': float(row['max_confidence']),
+                    'person_count': int(row['person_count']),
+                    'product_count': int(row['product_count'])
+                })
+        return statistics
+    
+    def generate_summary_statistics(self, results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Generate summary statistics from detection results"""
+        statistics = DetectionStatistics()
+        for result in results:
+            statistics.add(result)
+        return statistics.summary()
     
-    def run_detection_pipeline(self):
+    def run_detection_pipeline(self, images: Optional[Iterable[Path]] = None):
         """Run the complete detection pipeline"""
         logger.info("Starting YOLO detection pipeline")
         
         try:
-            # Process all images
-            results = self.process_all_images()
+            # Process all images, writing each result out as it is produced
+            csv_path = self.results_path / 'yolo_detections.csv'
+            json_path = self.results_path / 'yolo_detections_detailed.jsonl'
+            processed_keys = self.load_processed_keys(csv_path) if self.resume else set()
+            results, statistics = self.save_results(
+                self.iter_results(images, processed_keys), csv_path, json_path, append=bool(processed_keys)
+            )
             
-            if not results:
+            if not results and not self.images_skipped:
                 logger.warning("No images were processed successfully")
                 return
             
-            # Save results
-            csv_path = self.save_results_to_csv(results)
-            json_path = self.save_detailed_results(results)
+            if not results:
+                logger.info("No new images to process; all images already have results")
             
-            # Generate statistics
-            stats = self.generate_summary_statistics(results)
+            # Statistics cover the whole results file; after a resumed run that includes earlier rows
+            if processed_keys:
+                statistics = self.load_csv_statistics(csv_path)
+            stats = statistics.summary()
             
             # Save statistics
             stats_path = self.results_path / 'detection_statistics.json'
@@ -350,6 +818,7 @@ class YOLODetector:
             
             # Log summary
             logger.info("=== Detection Pipeline Summary ===")
+            logger.info(f"Images processed this run: {len(results)}")
             logger.info(f"Total images processed: {stats.get('total_images_processed', 0)}")
             logger.info(f"Image categories: {stats.get('image_categories', {})}")
             logger.info(f"Channels processed: {stats.get('channels_processed', 0)}")
@@ -361,6 +830,7 @@ class YOLODetector:
                 'results': results,
                 'csv_path': csv_path,
                 'json_path': json_path,
+                'images_processed': len(results),
                 'statistics': stats
             }
             
@@ -368,6 +838,15 @@ class YOLODetector:
             logger.error(f"Error in detection pipeline: {e}")
             raise
 
+def detection_worker(model_name: str, device: str, batch_queue, result_queue):
+    """Worker process body: detect objects on one GPU for each path batch until a None sentinel"""
+    detector = YOLODetector(model_name)
+    detector.device = device
+    detector.prepare_model()
+    
+    for batch in iter(batch_queue.get, None):
+        result_queue.put(list(detector.detect_objects_batched(batch)))
+
 def main():
     """Main function"""
     detector = YOLODetector()
@@ -379,7 +858,8 @@ def main():
             print("\n=== YOLO Detection Complete ===")
             print(f"Results saved to: {pipeline_results['csv_path']}")
             print(f"Statistics saved to: results/detection_statistics.json")
-            print(f"Images processed: {pipeline_results['statistics']['total_images_processed']}")
+            print(f"Images processed this run: {pipeline_results['images_processed']}")
+            print(f"Total images with results: {pipeline_results['statistics'].get('total_images_processed', 0)}")
         
     except Exception as e:
         logger.error(f"Detection pipeline failed: {e}")